@@ -1,48 +1,160 @@
 from celery import Celery
+from celery.signals import (
+    before_task_publish, task_received, task_prerun, task_postrun, task_failure,
+    worker_process_shutdown, worker_shutdown
+)
 import time
 import os
 import random
-import math
 from celery.utils.log import get_task_logger
+from queue_stats import TaskRuntimeStats
+from redis_pool import client as redis_client, transport_settings
+from metrics import metrics as task_metrics
+from progress import ProgressReporter
+from result_policy import RESULT_EXPIRES, ResultPolicyTask, task_annotations
+from serialization import COMPACT_SERIALIZER, register_compact_serializer, serializer_setting
+from tuning import TUNING_PROFILE, apply_profile
+from workloads import series_sum, resolve_mode, write_lines, count_lines
 
 # Configure Celery
 app = Celery('autoscaling_demo')
 
-# Redis broker configuration
+# Queues per task type, each consumed by its own worker deployment
+DEFAULT_QUEUE = os.getenv('DEFAULT_QUEUE', 'default')
+CPU_QUEUE = os.getenv('CPU_QUEUE', 'cpu')
+IO_QUEUE = os.getenv('IO_QUEUE', 'io')
+# Cost of one written/read line relative to one series term, for routing mixed tasks
+MIXED_IO_WEIGHT = float(os.getenv('MIXED_IO_WEIGHT', 2.0))
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Send CPU-bound work to prefork workers and I/O-bound work to the thread pool.
+
+    mixed_task goes to whichever side dominates its arguments. Unknown
+    tasks fall through to the default queue.
+    """
+    if name == 'tasks.cpu_intensive':
+        return {'queue': CPU_QUEUE}
+    if name == 'tasks.io_bound':
+        return {'queue': IO_QUEUE}
+    if name == 'tasks.mixed_task':
+        args = list(args or ())
+        kwargs = kwargs or {}
+        cpu_complexity = kwargs.get('cpu_complexity', args[0] if len(args) > 0 else 500)
+        io_size = kwargs.get('io_size', args[1] if len(args) > 1 else 512)
+        return {'queue': CPU_QUEUE if cpu_complexity >= MIXED_IO_WEIGHT * io_size else IO_QUEUE}
+    return None
+
+# Workers always accept both encodings; producers switch to msgpackz only
+# once every consumer runs this code, so old JSON-only workers keep working
+COMPACT_AVAILABLE = register_compact_serializer()
+TASK_SERIALIZER = serializer_setting(os.getenv('TASK_SERIALIZER', 'json'), COMPACT_AVAILABLE)
+RESULT_SERIALIZER = serializer_setting(os.getenv('RESULT_SERIALIZER', 'json'), COMPACT_AVAILABLE)
+
+# Redis broker and result backend (see redis_pool.py)
 app.conf.update(
-    broker_url='redis://redis-service:6379/0',
-    result_backend='redis://redis-service:6379/0',
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    **transport_settings(),
+    task_serializer=TASK_SERIALIZER,
+    accept_content=['json', COMPACT_SERIALIZER] if COMPACT_AVAILABLE else ['json'],
+    result_serializer=RESULT_SERIALIZER,
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
+    # Results expire instead of piling up; per-task policies trim what is stored
+    result_expires=RESULT_EXPIRES,
+    task_annotations=task_annotations(['tasks.cpu_intensive', 'tasks.io_bound', 'tasks.mixed_task']),
     task_time_limit=300,  # 5 minutes max
     task_soft_time_limit=240,  # 4 minutes soft limit
+    task_default_queue=DEFAULT_QUEUE,
+    task_routes=(route_task,),
 )
+# Prefetch, acks and child recycling (see tuning.py)
+apply_profile(app, TUNING_PROFILE)
 
 logger = get_task_logger(__name__)
 
-@app.task(bind=True, name='tasks.cpu_intensive')
-def cpu_intensive_task(self, complexity=1000):
+# Shared runtime counters used by the metrics adapter to estimate backlog seconds.
+# Each process batches its executions and writes them every RUNTIME_FLUSH_TASKS
+# tasks or RUNTIME_FLUSH_INTERVAL seconds, whichever comes first.
+RUNTIME_FLUSH_TASKS = int(os.getenv('RUNTIME_FLUSH_TASKS', 50))
+RUNTIME_FLUSH_INTERVAL = float(os.getenv('RUNTIME_FLUSH_INTERVAL', 5))
+runtime_stats = TaskRuntimeStats(redis_client(), flush_every=RUNTIME_FLUSH_TASKS,
+                                 flush_interval=RUNTIME_FLUSH_INTERVAL)
+_task_started = {}
+
+# Lifecycle hooks. Enqueue time travels as a wall-clock message header because
+# it crosses processes; execution time uses the monotonic clock in the child.
+
+@before_task_publish.connect
+def _on_before_task_publish(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
+@task_received.connect
+def _on_task_received(request=None, **kwargs):
+    task_metrics.record_task_event(request.task_name, 'received')
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = (time.monotonic(), time.time())
+    enqueued_at = task.request.get('enqueued_at')
+    if enqueued_at is not None:
+        task_metrics.record_queue_wait(task.name, time.time() - enqueued_at)
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is None:
+        return
+    runtime = time.monotonic() - started[0]
+    if state == 'SUCCESS':
+        status = 'completed'
+    elif state == 'FAILURE':
+        status = None  # counted once, as 'failed', by _on_task_failure
+    else:
+        status = (state or 'unknown').lower()
+    task_metrics.record_task_completion(task.name, runtime, status)
+    enqueued_at = task.request.get('enqueued_at')
+    if enqueued_at is not None:
+        task_metrics.record_end_to_end_latency(task.name, time.time() - enqueued_at)
+    try:
+        runtime_stats.record(task.name, runtime)
+    except Exception as e:
+        logger.warning(f"Could not record runtime for {task.name}: {e}")
+
+@task_failure.connect
+def _on_task_failure(sender=None, exception=None, **kwargs):
+    task_metrics.record_task_event(sender.name, 'failed')
+
+def _flush_runtime_stats():
+    try:
+        runtime_stats.flush()
+    except Exception as e:
+        logger.warning(f"Could not flush task runtimes: {e}")
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(pid=None, **kwargs):
+    _flush_runtime_stats()
+    task_metrics.mark_process_dead(pid or os.getpid())
+
+@worker_shutdown.connect
+def _on_worker_shutdown(**kwargs):
+    # Thread and solo pools run tasks in the main process, which has no process shutdown signal
+    _flush_runtime_stats()
+
+@app.task(bind=True, base=ResultPolicyTask, name='tasks.cpu_intensive')
+def cpu_intensive_task(self, complexity=1000, execution_mode=None):
     """
     CPU-intensive task that simulates heavy computation
     """
-    logger.info(f"Starting CPU-intensive task {self.request.id} with complexity {complexity}")
+    execution_mode = resolve_mode(execution_mode)
+    logger.info(f"Starting CPU-intensive task {self.request.id} with complexity {complexity} ({execution_mode})")
     
     start_time = time.time()
     
-    # Simulate CPU-intensive work
-    result = 0
-    for i in range(complexity):
-        result += math.sqrt(i) * math.sin(i) * math.cos(i)
-        if i % 100 == 0:
-            # Update task state
-            self.update_state(
-                state='PROGRESS',
-                meta={'current': i, 'total': complexity, 'result': result}
-            )
+    # Simulate CPU-intensive work (progress updates are throttled)
+    progress = ProgressReporter(self, complexity)
+    result = series_sum(complexity, with_cos=True, mode=execution_mode,
+                        on_progress=lambda i, partial: progress.update(i, result=partial))
     
     processing_time = time.time() - start_time
     logger.info(f"CPU-intensive task {self.request.id} completed in {processing_time:.2f}s")
@@ -51,12 +163,14 @@ def cpu_intensive_task(self, complexity=1000):
         'task_id': self.request.id,
         'type': 'cpu_intensive',
         'complexity': complexity,
+        'execution_mode': execution_mode,
+        'started_at': start_time,
         'processing_time': processing_time,
         'result': result
     }
 
-@app.task(bind=True, name='tasks.io_bound')
-def io_bound_task(self, file_size=1024):
+@app.task(bind=True, base=ResultPolicyTask, name='tasks.io_bound')
+def io_bound_task(self, file_size=1024, verify_mode=None):
     """
     I/O-bound task that simulates file operations
     """
@@ -67,19 +181,13 @@ def io_bound_task(self, file_size=1024):
     # Simulate I/O operations
     temp_file = f"/tmp/task_{self.request.id}.tmp"
     
-    # Simulate file write
-    with open(temp_file, 'w') as f:
-        for i in range(file_size):
-            f.write(f"Line {i}: Some data for task {self.request.id}\n")
-            if i % 100 == 0:
-                self.update_state(
-                    state='PROGRESS',
-                    meta={'current': i, 'total': file_size, 'operation': 'writing'}
-                )
+    # Simulate file write (batched writelines, throttled progress)
+    progress = ProgressReporter(self, file_size)
+    write_lines(temp_file, file_size, f"Line {{}}: Some data for task {self.request.id}\n",
+                on_progress=lambda written: progress.update(written, operation='writing'))
     
-    # Simulate file read
-    with open(temp_file, 'r') as f:
-        lines = f.readlines()
+    # Simulate file read (streamed newline count)
+    lines_processed = count_lines(temp_file, verify_mode)
     
     # Cleanup
     os.remove(temp_file)
@@ -91,32 +199,30 @@ def io_bound_task(self, file_size=1024):
         'task_id': self.request.id,
         'type': 'io_bound',
         'file_size': file_size,
+        'started_at': start_time,
         'processing_time': processing_time,
-        'lines_processed': len(lines)
+        'lines_processed': lines_processed
     }
 
-@app.task(bind=True, name='tasks.mixed_task')
-def mixed_task(self, cpu_complexity=500, io_size=512):
+@app.task(bind=True, base=ResultPolicyTask, name='tasks.mixed_task')
+def mixed_task(self, cpu_complexity=500, io_size=512, execution_mode=None, verify_mode=None):
     """
     Mixed task that combines both CPU and I/O operations
     """
-    logger.info(f"Starting mixed task {self.request.id}")
+    execution_mode = resolve_mode(execution_mode)
+    logger.info(f"Starting mixed task {self.request.id} ({execution_mode})")
     
     start_time = time.time()
     
     # CPU-intensive part
-    result = 0
-    for i in range(cpu_complexity):
-        result += math.sqrt(i) * math.sin(i)
+    progress = ProgressReporter(self, cpu_complexity)
+    result = series_sum(cpu_complexity, with_cos=False, mode=execution_mode,
+                        on_progress=lambda i, partial: progress.update(i, operation='computing'))
     
     # I/O part
     temp_file = f"/tmp/mixed_task_{self.request.id}.tmp"
-    with open(temp_file, 'w') as f:
-        for i in range(io_size):
-            f.write(f"Mixed task data {i}: {result}\n")
-    
-    with open(temp_file, 'r') as f:
-        lines = f.readlines()
+    write_lines(temp_file, io_size, f"Mixed task data {{}}: {result}\n")
+    lines_processed = count_lines(temp_file, verify_mode)
     
     os.remove(temp_file)
     
@@ -128,9 +234,11 @@ def mixed_task(self, cpu_complexity=500, io_size=512):
         'type': 'mixed',
         'cpu_complexity': cpu_complexity,
         'io_size': io_size,
+        'execution_mode': execution_mode,
+        'started_at': start_time,
         'processing_time': processing_time,
         'result': result,
-        'lines_processed': len(lines)
+        'lines_processed': lines_processed
     }
 
 if __name__ == '__main__':
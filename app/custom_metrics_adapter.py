@@ -5,43 +5,330 @@ Exposes queue depth metrics to Kubernetes for autoscaling decisions
 """
 
 import os
+import sys
 import time
+import signal
+import socket
+import threading
 import requests
+import re
 import json
-from flask import Flask, jsonify, request
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, jsonify, request
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from queue_stats import PoolCapacityRegistry, QueueDepthCollector, TaskRuntimeStats
+from redis_pool import client as redis_client
+from predictive_scaler import PredictiveScaler
+from serving import serve
 
 app = Flask(__name__)
 
 # Configuration
-CELERY_SERVICE_URL = os.getenv('CELERY_SERVICE_URL', 'http://celery-worker-service:8000')
 METRICS_PORT = int(os.getenv('METRICS_PORT', 8080))
+# 'redis' reads the broker directly, 'pods' fans out to every worker pod
+DEPTH_SOURCE = os.getenv('DEPTH_SOURCE', 'redis')
+CELERY_PODS_SERVICE = os.getenv('CELERY_PODS_SERVICE', 'celery-worker-headless')
+CELERY_PODS_PORT = int(os.getenv('CELERY_PODS_PORT', 8000))
+REFRESH_INTERVAL = float(os.getenv('REFRESH_INTERVAL', 5))
+POD_TIMEOUT = float(os.getenv('POD_TIMEOUT', 2))
+# Messages sampled per priority list to split the backlog by task name
+TASK_SAMPLE_SIZE = int(os.getenv('TASK_SAMPLE_SIZE', 200))
+# Assumed service time until a task type has completed at least once
+DEFAULT_SERVICE_TIME = float(os.getenv('DEFAULT_SERVICE_TIME', 1.0))
+# Optional NDJSON file receiving every controller input for offline replay
+SCALER_TRACE_FILE = os.getenv('SCALER_TRACE_FILE')
+# Pool reports from in-pod autoscalers older than this are ignored
+POOL_REPORT_MAX_AGE = float(os.getenv('POOL_REPORT_MAX_AGE', 60))
+
+API_PREFIX = '/apis/custom.metrics.k8s.io/v1beta1'
+METRIC_NAMES = ['queue_depth', 'backlog_seconds', 'desired_workers']
+
+_SELECTOR_TERM = re.compile(r'^\s*(!?)\s*([\w./-]+)\s*(?:(==|=|!=)\s*([\w./-]*)|\s+(in|notin)\s*\(([^)]*)\))?\s*$')
+
+def parse_selector(text):
+    """Parse a Kubernetes label selector into (key, op, values) terms"""
+    terms = []
+    for raw in re.split(r',(?![^(]*\))', text or ''):
+        if not raw.strip():
+            continue
+        match = _SELECTOR_TERM.match(raw)
+        if match is None:
+            raise ValueError(f"invalid label selector term: {raw!r}")
+        negate, key, eq_op, eq_value, set_op, set_values = match.groups()
+        if negate and (eq_op or set_op):
+            # '!' only negates existence, as in Kubernetes ('!queue', not '!queue=cpu')
+            raise ValueError(f"invalid label selector term: {raw!r}")
+        if eq_op:
+            terms.append((key, '!=' if eq_op == '!=' else '=', {eq_value}))
+        elif set_op:
+            values = {v.strip() for v in set_values.split(',') if v.strip()}
+            if not values:
+                raise ValueError(f"empty value set in label selector term: {raw!r}")
+            terms.append((key, set_op, values))
+        else:
+            terms.append((key, '!exists' if negate else 'exists', set()))
+    return terms
+
+def matches_selector(labels, terms):
+    """Check a label dict against parsed selector terms"""
+    for key, op, values in terms:
+        value = labels.get(key)
+        if op in ('=', 'in') and value not in values:
+            return False
+        if op in ('!=', 'notin') and value in values:
+            return False
+        if op == 'exists' and key not in labels:
+            return False
+        if op == '!exists' and key in labels:
+            return False
+    return True
+
 
 class CustomMetricsAdapter:
+    """Keeps a cached view of queue metrics that is refreshed in the background.
+
+    HPA requests never trigger I/O: they are answered from the latest
+    snapshot, and each distinct response body is serialized once per refresh.
+    """
+
     def __init__(self):
         self.last_queue_depth = 0
+        self.last_breakdown = {'queues': {}, 'unacked': 0, 'total': 0}
         self.last_update = 0
-        self.update_interval = 5  # Update every 5 seconds
-        
+        self.update_interval = REFRESH_INTERVAL
+        self.redis_client = redis_client(decode_responses=True)
+        self.collector = QueueDepthCollector(self.redis_client, sample_size=TASK_SAMPLE_SIZE, unacked_detail=True)
+        self.runtime_stats = TaskRuntimeStats(self.redis_client)
+        self.pool_registry = PoolCapacityRegistry(self.redis_client)
+        self.pools = {}
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=16, pool_maxsize=16))
+        self.executor = ThreadPoolExecutor(max_workers=16)
+        self.pods = []
+        self.series = []
+        self.service_times = {}
+        self.scaler = PredictiveScaler()
+        self._runtime_totals = {}
+        self._responses = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._trace = None
+
+    def start(self):
+        """Start the background refresher"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='depth-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background refresher and close the scaler trace"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        if SCALER_TRACE_FILE:
+            # Line-buffered: each sample reaches the file as it is written
+            self._trace = open(SCALER_TRACE_FILE, 'a', buffering=1)
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Exception refreshing queue depth: {e}")
+                self._stop.wait(max(0, self.update_interval - (time.monotonic() - started)))
+        finally:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+    def refresh(self):
+        """Collect queue metrics from the configured source and publish them"""
+        replies = self._poll_pods()
+        if DEPTH_SOURCE == 'pods':
+            breakdown = self._breakdown_from_pods(replies)
+        else:
+            breakdown = self.collector.collect()
+        if breakdown is None:
+            return
+        self._update_service_times()
+        self._update_pool_capacity()
+        self.pods = [{'name': r.get('pod', address), 'labels': r.get('labels', {})}
+                     for address, r in sorted(replies.items())]
+        self.series = self._build_series(breakdown)
+        now = time.time()
+        self._observe_scaler(now, breakdown)
+        self.last_breakdown = breakdown
+        self.last_queue_depth = breakdown['total']
+        self.last_update = now
+        # Invalidate serialized responses built from the previous snapshot
+        self._responses = {}
+
+    def _pod_addresses(self):
+        """Resolve every worker pod behind the headless service"""
+        infos = socket.getaddrinfo(CELERY_PODS_SERVICE, CELERY_PODS_PORT, proto=socket.IPPROTO_TCP)
+        return sorted({info[4][0] for info in infos})
+
+    def _fetch_pod(self, address):
+        response = self.session.get(f"http://{address}:{CELERY_PODS_PORT}/queue-depth", timeout=POD_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _poll_pods(self):
+        """Query all worker pods in parallel, returning {address: reply}"""
+        try:
+            addresses = self._pod_addresses()
+        except OSError as e:
+            if DEPTH_SOURCE == 'pods':
+                print(f"Error resolving {CELERY_PODS_SERVICE}: {e}")
+            return {}
+        futures = {self.executor.submit(self._fetch_pod, address): address for address in addresses}
+        done, _ = wait(futures, timeout=POD_TIMEOUT)
+        return {futures[f]: f.result() for f in done if f.exception() is None}
+
+    def _breakdown_from_pods(self, replies):
+        if not replies:
+            print("Error getting queue depth: no worker pod answered")
+            return None
+        # Every pod reads the same broker, so the largest reading is the most recent
+        best = max(replies.values(), key=lambda r: r.get('queue_depth', 0))
+        return {
+            'queues': best.get('queues', {}),
+            'unacked': best.get('unacked', 0),
+            'unacked_queues': best.get('unacked_queues'),
+            'total': best.get('queue_depth', 0)
+        }
+
+    def _update_service_times(self):
+        """Mean service time per task over the last refresh window"""
+        try:
+            totals = self.runtime_stats.totals()
+        except Exception as e:
+            print(f"Exception reading task runtimes: {e}")
+            return
+        for name, (runtime_sum, count) in totals.items():
+            prev_sum, prev_count = self._runtime_totals.get(name, (0.0, 0))
+            if count > prev_count:
+                self.service_times[name] = (runtime_sum - prev_sum) / (count - prev_count)
+            elif name not in self.service_times and count:
+                self.service_times[name] = runtime_sum / count
+        self._runtime_totals = totals
+
+    def _update_pool_capacity(self):
+        """Size desired_workers with the pools the in-pod autoscalers can reach.
+
+        Each pod grows its own pool up to its capacity within seconds, so the
+        replica count only has to cover what that capacity cannot absorb.
+        Without reports the scaler keeps its configured concurrency.
+        """
+        try:
+            self.pools = self.pool_registry.pools(POOL_REPORT_MAX_AGE, time.time())
+        except Exception as e:
+            print(f"Exception reading pool capacity: {e}")
+            return
+        if self.pools:
+            capacities = [report['capacity'] for report in self.pools.values()]
+            self.scaler.concurrency = sum(capacities) / len(capacities)
+
+    def service_time(self, task_name=None):
+        """Mean service time for a task, or across all tasks"""
+        if task_name in self.service_times:
+            return self.service_times[task_name]
+        if self.service_times:
+            return sum(self.service_times.values()) / len(self.service_times)
+        return DEFAULT_SERVICE_TIME
+
+    def _build_series(self, breakdown):
+        """Split the backlog into labelled series of (labels, depth, backlog seconds).
+
+        Depth is ready plus unacked (reserved or running) messages, so a
+        selector over every queue adds up to the unselected total. Unacked
+        messages count against the queue they were delivered from, and as
+        one full service time each.
+        """
+        counts = {}
+
+        def add(queue, task_name, count):
+            key = (queue, task_name)
+            counts[key] = counts.get(key, 0) + count
+
+        tasks = breakdown.get('tasks') or {}
+        for queue, depth in breakdown['queues'].items():
+            sampled = tasks.get(queue)
+            if sampled and depth:
+                # Scale the rounded sample counts back to the exact list length
+                scale = depth / sum(sampled.values())
+                for task_name, count in sampled.items():
+                    add(queue, task_name, count * scale)
+            elif depth:
+                add(queue, None, depth)
+        unacked_queues = breakdown.get('unacked_queues')
+        if unacked_queues is None:
+            # Pod replies without per-queue detail: counted, but matched by no selector
+            if breakdown['unacked']:
+                add(None, None, breakdown['unacked'])
+        else:
+            for queue, per_task in unacked_queues.items():
+                for task_name, count in per_task.items():
+                    add(queue, task_name if tasks else None, count)
+
+        series = []
+        for (queue, task_name), count in counts.items():
+            labels = {}
+            if queue is not None:
+                labels['queue'] = queue
+            if task_name is not None:
+                labels['task'] = task_name
+            series.append((labels, count, count * self.service_time(task_name)))
+        return series
+
+    def _observe_scaler(self, timestamp, breakdown):
+        """Feed the predictive controller and optionally record its inputs"""
+        depth = sum(s[1] for s in self.series)
+        # Weight service time by the task mix that is actually queued or in flight
+        service_time = sum(s[2] for s in self.series) / depth if depth else self.service_time()
+        sample = {
+            'timestamp': timestamp,
+            'queue_depth': breakdown['total'],
+            'completed': sum(count for _, count in self._runtime_totals.values()),
+            'service_time': service_time
+        }
+        self.scaler.observe(**sample)
+        if self._trace is not None:
+            self._trace.write(json.dumps(sample) + '\n')
+
     def get_queue_depth(self):
-        """Get queue depth from Celery service"""
-        current_time = time.time()
-        
-        # Only update if enough time has passed
-        if current_time - self.last_update >= self.update_interval:
-            try:
-                response = requests.get(f"{CELERY_SERVICE_URL}/queue-depth", timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    self.last_queue_depth = data.get('queue_depth', 0)
-                    self.last_update = current_time
-                else:
-                    print(f"Error getting queue depth: {response.status_code}")
-            except Exception as e:
-                print(f"Exception getting queue depth: {e}")
-        
+        """Get the last collected queue depth"""
         return self.last_queue_depth
 
+    def metric_value(self, metric, selector=None):
+        """Aggregate a metric over the series matching a metricLabelSelector"""
+        if metric == 'desired_workers':
+            # Sized for the whole backlog; label selectors do not apply
+            return self.scaler.desired
+        # Ready plus unacked messages whether or not a selector is given
+        index = 1 if metric == 'queue_depth' else 2
+        return round(sum(s[index] for s in self.series if not selector or matches_selector(s[0], selector)), 3)
+
+    def age(self):
+        """Seconds since the cached data was collected"""
+        return time.time() - self.last_update if self.last_update else None
+
+    def cached_response(self, key, build):
+        """Serve a response body serialized at most once per refresh"""
+        responses = self._responses
+        body = responses.get(key)
+        if body is None:
+            body = json.dumps(build())
+            responses[key] = body
+        age = self.age()
+        return Response(body, mimetype='application/json',
+                        headers={'X-Metric-Age-Seconds': f"{age:.3f}" if age is not None else 'unknown'})
+
 # Global adapter instance
 adapter = CustomMetricsAdapter()
 
@@ -53,98 +340,120 @@ def health():
 @app.route('/ready')
 def ready():
     """Readiness check endpoint"""
-    try:
-        # Check if we can reach the Celery service
-        response = requests.get(f"{CELERY_SERVICE_URL}/health", timeout=5)
-        if response.status_code == 200:
-            return jsonify({'status': 'ready'})
-        else:
-            return jsonify({'status': 'not ready'}), 503
-    except Exception as e:
-        return jsonify({'status': 'not ready', 'error': str(e)}), 503
+    age = adapter.age()
+    if age is not None and age < 3 * adapter.update_interval:
+        return jsonify({'status': 'ready', 'age_seconds': age})
+    return jsonify({'status': 'not ready', 'age_seconds': age}), 503
 
 @app.route('/metrics')
 def metrics():
     """Prometheus metrics endpoint"""
     return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
 
-@app.route('/apis/custom.metrics.k8s.io/v1beta1/namespaces/<namespace>/services/<service_name>/queue_depth')
-def custom_metrics(namespace, service_name):
-    """Custom metrics endpoint for Kubernetes HPA"""
-    queue_depth = adapter.get_queue_depth()
-    
-    # Return in Kubernetes custom metrics format
+def _status(code, reason, message):
+    """Kubernetes Status object for error responses"""
     return jsonify({
+        "kind": "Status",
+        "apiVersion": "v1",
+        "status": "Failure",
+        "reason": reason,
+        "message": message,
+        "code": code
+    }), code
+
+def _metric_value_list(metric, items):
+    return {
         "kind": "MetricValueList",
         "apiVersion": "custom.metrics.k8s.io/v1beta1",
         "metadata": {
-            "selfLink": f"/apis/custom.metrics.k8s.io/v1beta1/namespaces/{namespace}/services/{service_name}/queue_depth"
+            "selfLink": request.path
         },
         "items": [
             {
-                "describedObject": {
-                    "kind": "Service",
-                    "name": service_name,
-                    "apiVersion": "v1"
-                },
-                "metricName": "queue_depth",
-                "timestamp": time.time(),
-                "value": queue_depth
+                "describedObject": described,
+                "metricName": metric,
+                "timestamp": adapter.last_update,
+                "windowSeconds": adapter.update_interval,
+                "value": value
             }
+            for described, value in items
         ]
-    })
+    }
+
+def _serve_object_metric(kind, api_version, namespace, name, metric):
+    """Single-object metric (Service or Deployment) honoring metricLabelSelector"""
+    if metric not in METRIC_NAMES:
+        return _status(404, 'NotFound', f"metric {metric} is not served")
+    try:
+        selector = parse_selector(request.args.get('metricLabelSelector'))
+    except ValueError as e:
+        return _status(400, 'BadRequest', str(e))
+    described = {"kind": kind, "namespace": namespace, "name": name, "apiVersion": api_version}
+    return adapter.cached_response(request.full_path, lambda: _metric_value_list(
+        metric, [(described, adapter.metric_value(metric, selector))]
+    ))
 
-@app.route('/apis/custom.metrics.k8s.io/v1beta1/namespaces/<namespace>/pods/*/queue_depth')
-def pod_metrics(namespace):
-    """Pod-level metrics endpoint"""
-    queue_depth = adapter.get_queue_depth()
-    
+@app.route(f'{API_PREFIX}')
+def api_resources():
+    """Discovery document listing the served metrics"""
+    resources = []
+    for resource in ('services', 'deployments', 'pods'):
+        for metric in METRIC_NAMES:
+            resources.append({
+                "name": f"{resource}/{metric}",
+                "singularName": "",
+                "namespaced": True,
+                "kind": "MetricValueList",
+                "verbs": ["get"]
+            })
     return jsonify({
-        "kind": "MetricValueList",
-        "apiVersion": "custom.metrics.k8s.io/v1beta1",
-        "metadata": {
-            "selfLink": f"/apis/custom.metrics.k8s.io/v1beta1/namespaces/{namespace}/pods/*/queue_depth"
-        },
-        "items": [
-            {
-                "describedObject": {
-                    "kind": "Pod",
-                    "name": "*",
-                    "apiVersion": "v1"
-                },
-                "metricName": "queue_depth",
-                "timestamp": time.time(),
-                "value": queue_depth
-            }
-        ]
+        "kind": "APIResourceList",
+        "apiVersion": "v1",
+        "groupVersion": "custom.metrics.k8s.io/v1beta1",
+        "resources": resources
     })
 
-@app.route('/apis/custom.metrics.k8s.io/v1beta1/namespaces/<namespace>/deployments/*/queue_depth')
-def deployment_metrics(namespace):
+@app.route(f'{API_PREFIX}/namespaces/<namespace>/services/<service_name>/<metric>')
+def custom_metrics(namespace, service_name, metric):
+    """Custom metrics endpoint for Kubernetes HPA"""
+    return _serve_object_metric('Service', 'v1', namespace, service_name, metric)
+
+@app.route(f'{API_PREFIX}/namespaces/<namespace>/deployments/<deployment_name>/<metric>')
+def deployment_metrics(namespace, deployment_name, metric):
     """Deployment-level metrics endpoint"""
-    queue_depth = adapter.get_queue_depth()
-    
-    return jsonify({
-        "kind": "MetricValueList",
-        "apiVersion": "custom.metrics.k8s.io/v1beta1",
-        "metadata": {
-            "selfLink": f"/apis/custom.metrics.k8s.io/v1beta1/namespaces/{namespace}/deployments/*/queue_depth"
-        },
-        "items": [
-            {
-                "describedObject": {
-                    "kind": "Deployment",
-                    "name": "*",
-                    "apiVersion": "apps/v1"
-                },
-                "metricName": "queue_depth",
-                "timestamp": time.time(),
-                "value": queue_depth
-            }
-        ]
-    })
+    return _serve_object_metric('Deployment', 'apps/v1', namespace, deployment_name, metric)
+
+@app.route(f'{API_PREFIX}/namespaces/<namespace>/pods/<pod_name>/<metric>')
+def pod_metrics(namespace, pod_name, metric):
+    """Pod-level metrics endpoint.
+
+    The selected backlog is shared evenly across the matching pods, so the
+    HPA's per-pod average equals backlog / pods as with an Object metric.
+    """
+    if metric not in METRIC_NAMES:
+        return _status(404, 'NotFound', f"metric {metric} is not served")
+    try:
+        selector = parse_selector(request.args.get('metricLabelSelector'))
+        pod_selector = parse_selector(request.args.get('labelSelector'))
+    except ValueError as e:
+        return _status(400, 'BadRequest', str(e))
+
+    def build():
+        pods = [p for p in adapter.pods if matches_selector(p['labels'], pod_selector)]
+        share = round(adapter.metric_value(metric, selector) / len(pods), 3) if pods else 0
+        return _metric_value_list(metric, [
+            ({"kind": "Pod", "namespace": namespace, "name": p['name'], "apiVersion": "v1"}, share)
+            for p in pods if pod_name == '*' or p['name'] == pod_name
+        ])
+    return adapter.cached_response(request.full_path, build)
 
 if __name__ == '__main__':
     print(f"Starting Custom Metrics Adapter on port {METRICS_PORT}")
-    print(f"Celery service URL: {CELERY_SERVICE_URL}")
-    app.run(host='0.0.0.0', port=METRICS_PORT, debug=False)
+    print(f"Queue depth source: {DEPTH_SOURCE}")
+    # Kubernetes stops pods with SIGTERM; exit through the finally below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    adapter.start()
+    try:
+        serve(app, METRICS_PORT)
+    finally:
+        adapter.stop()
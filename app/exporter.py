@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Metrics Exporter
+Standalone sidecar serving worker metrics from Redis, Celery events and the shared multiprocess directory
+"""
+
+import os
+import time
+import threading
+
+# Worker processes write counters and histograms to files in this directory.
+# The exporter only reads them and keeps its own metrics in memory, so the
+# variable is taken out of the environment before prometheus_client loads.
+SHARED_MULTIPROC_DIR = os.environ.pop('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+import psutil
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, multiprocess
+
+import metrics as metrics_module
+from metrics import POD_NAME, CeleryMetrics, EndpointSnapshots, ResourceSampler, app
+from redis_pool import BROKER_URL
+from serving import serve
+
+EXPORTER_PORT = int(os.getenv('EXPORTER_PORT', 8000))
+# Command-line fragment identifying the worker's main process
+WORKER_CMDLINE = os.getenv('WORKER_CMDLINE', 'worker.py')
+# Memory limit of the worker container (downward API), since the exporter's cgroup is its own
+WORKER_MEMORY_LIMIT = int(os.getenv('WORKER_MEMORY_LIMIT', 0))
+# Task IDs remembered between task-received and the final event, bounding memory
+MAX_TRACKED_TASKS = int(os.getenv('MAX_TRACKED_TASKS', 100000))
+# Node name of the worker in this pod (worker.py starts it as worker@%h); events
+# from every other worker are ignored so each pod's sidecar counts only its own
+WORKER_HOSTNAME = os.getenv('WORKER_HOSTNAME', f'worker@{POD_NAME}')
+
+TASK_EVENTS = Counter('celery_task_events_total', 'Task events received from workers', ['task_type', 'event'])
+WORKERS_ONLINE = Gauge('celery_workers_online', "This pod's worker announced online over Celery events (0 or 1)")
+
+# Families the exporter computes itself; copies in the shared directory are dropped
+OWNED_FAMILIES = {
+    'celery_queue_depth', 'celery_queue_length', 'celery_unacked_tasks', 'celery_worker_cpu_percent',
+    'celery_worker_memory_bytes', 'celery_active_workers', 'celery_task_events', 'celery_workers_online'
+}
+
+
+def find_worker_pid():
+    """PID of the oldest process running the worker (its prefork children share the command line)"""
+    own_pid = os.getpid()
+    candidates = []
+    for proc in psutil.process_iter(['pid', 'cmdline', 'create_time']):
+        cmdline = ' '.join(proc.info['cmdline'] or [])
+        if proc.info['pid'] != own_pid and WORKER_CMDLINE in cmdline:
+            candidates.append((proc.info['create_time'], proc.info['pid']))
+    return min(candidates)[1] if candidates else None
+
+
+class WorkerSampler(ResourceSampler):
+    """Samples the worker's process tree from another container.
+
+    Needs shareProcessNamespace on the pod. The worker is looked up again
+    whenever its PID disappears, so worker restarts are followed.
+    """
+
+    def __init__(self, interval=None, window=30):
+        super().__init__(interval=interval, window=window)
+        self.pid = None
+        if WORKER_MEMORY_LIMIT:
+            self.memory_limit = WORKER_MEMORY_LIMIT
+
+    def _process_tree(self):
+        if self.pid is None or not psutil.pid_exists(self.pid):
+            self.pid = find_worker_pid()
+            self._processes = {}
+        if self.pid is None:
+            return []
+        return super()._process_tree()
+
+
+class EventMonitor:
+    """Counts task events per task type and tracks whether this pod's worker is online"""
+
+    def __init__(self, celery_app, hostname=WORKER_HOSTNAME):
+        self.celery_app = celery_app
+        self.hostname = hostname
+        self.task_names = {}
+        self.workers = set()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='event-monitor', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                with self.celery_app.connection_for_read() as connection:
+                    receiver = self.celery_app.events.Receiver(connection, handlers={'*': self.on_event})
+                    receiver.capture(limit=None, timeout=None, wakeup=False)
+            except Exception as e:
+                print(f"Error reading Celery events: {e}")
+                time.sleep(5)
+
+    def on_event(self, event):
+        # Every sidecar receives the whole cluster's events
+        if event.get('hostname') != self.hostname:
+            return
+        kind = event.get('type', '')
+        if kind.startswith('task-'):
+            uuid = event.get('uuid')
+            # Only the first events of a task carry its name
+            if event.get('name'):
+                if len(self.task_names) >= MAX_TRACKED_TASKS:
+                    self.task_names.pop(next(iter(self.task_names)))
+                self.task_names[uuid] = event['name']
+            if kind in ('task-succeeded', 'task-failed', 'task-rejected', 'task-revoked'):
+                task_type = self.task_names.pop(uuid, 'unknown')
+            else:
+                task_type = self.task_names.get(uuid, 'unknown')
+            TASK_EVENTS.labels(task_type=task_type, event=kind[len('task-'):]).inc()
+        elif kind in ('worker-online', 'worker-heartbeat'):
+            self.workers.add(event.get('hostname'))
+            WORKERS_ONLINE.set(len(self.workers))
+        elif kind == 'worker-offline':
+            self.workers.discard(event.get('hostname'))
+            WORKERS_ONLINE.set(len(self.workers))
+
+
+class SharedDirectoryCollector:
+    """The exporter's own families plus the workers' file-backed ones, without duplicates"""
+
+    def collect(self):
+        for family in REGISTRY.collect():
+            if family.name in OWNED_FAMILIES:
+                yield family
+        if os.path.isdir(SHARED_MULTIPROC_DIR):
+            for family in multiprocess.MultiProcessCollector(None, path=SHARED_MULTIPROC_DIR).collect():
+                if family.name not in OWNED_FAMILIES:
+                    yield family
+
+
+class ExporterMetrics(CeleryMetrics):
+    """CeleryMetrics observing the worker from outside its process"""
+
+    def __init__(self, redis_url=BROKER_URL):
+        super().__init__(redis_url)
+        self.sampler = WorkerSampler()
+        self._registry = CollectorRegistry(auto_describe=False)
+        self._registry.register(SharedDirectoryCollector())
+
+    def registry(self):
+        return self._registry
+
+    def mark_process_dead(self, pid):
+        """Worker processes are cleaned up by the worker itself"""
+
+
+def main():
+    from celery_app import app as celery_app
+
+    exporter_metrics = ExporterMetrics()
+    # The Flask routes in metrics.py serve whatever module-level snapshots holds
+    metrics_module.snapshots = EndpointSnapshots(exporter_metrics)
+
+    print(f"Starting metrics exporter on port {EXPORTER_PORT}")
+    print(f"Reading worker samples from {SHARED_MULTIPROC_DIR}")
+    exporter_metrics.sampler.start()
+    EventMonitor(celery_app).start()
+    metrics_module.snapshots.start()
+    serve(app, EXPORTER_PORT)
+
+
+if __name__ == '__main__':
+    main()
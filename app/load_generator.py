@@ -0,0 +1,140 @@
+"""
+Open-Loop Load Generator
+Deadline-based task arrival scheduling for the autoscaling load tests
+"""
+
+import csv
+import math
+import time
+import queue
+import random
+import threading
+
+
+def gradual_rate(duration_minutes=10, max_tasks_per_minute=20):
+    """Arrival rate (tasks/s) of the gradual pattern at t seconds"""
+    def rate(t):
+        minute = int(t // 60)
+        return int((minute + 1) * max_tasks_per_minute / duration_minutes) / 60.0
+    return rate
+
+
+def oscillating_rate(duration_minutes=15, base_tasks_per_minute=10, amplitude=15):
+    """Arrival rate (tasks/s) of the oscillating (sine wave) pattern at t seconds"""
+    def rate(t):
+        minute = int(t // 60)
+        oscillation = math.sin(2 * math.pi * minute / (duration_minutes / 2))
+        return max(1, int(base_tasks_per_minute + amplitude * oscillation)) / 60.0
+    return rate
+
+
+def arrival_times(rate_fn, duration, process='constant', rng=None, step=60.0):
+    """Yield arrival offsets in [0, duration) for a rate that is constant per step.
+
+    'constant' spaces arrivals evenly at 1/rate from the start of each step;
+    'poisson' draws exponential inter-arrival gaps. Restarting the Poisson
+    process at each step boundary is exact because it is memoryless.
+    """
+    if process not in ('constant', 'poisson'):
+        raise ValueError(f"unknown arrival process: {process}")
+    # Default to the module-level generator so random.seed() makes runs repeatable
+    rng = rng or random
+    step_start = 0.0
+    while step_start < duration:
+        step_end = min(step_start + step, duration)
+        rate = rate_fn(step_start)
+        if rate > 0:
+            if process == 'constant':
+                # Count by index so float accumulation cannot add an arrival
+                count = math.ceil((step_end - step_start) * rate - 1e-9)
+                for k in range(count):
+                    yield step_start + k / rate
+            else:
+                t = step_start + rng.expovariate(rate)
+                while t < step_end:
+                    yield t
+                    t += rng.expovariate(rate)
+        step_start = step_end
+
+
+class OpenLoopScheduler:
+    """Releases jobs on absolute deadlines to a pool of producer threads.
+
+    The dispatcher never waits for a publish to finish, so slow publishes do
+    not lower the offered rate. Each send records its scheduled offset, the
+    offset at which a producer actually started it and when it completed;
+    the gap between scheduled and actual exposes coordinated omission.
+    """
+
+    def __init__(self, send, producers=4):
+        self.send = send
+        self.producers = producers
+        self.records = []
+        self.elapsed = 0.0
+
+    def run(self, jobs):
+        """Run an iterable of (offset_seconds, payload) sorted by offset"""
+        pending = queue.Queue()
+        per_thread = [[] for _ in range(self.producers)]
+        start = time.monotonic()
+        threads = [threading.Thread(target=self._produce, args=(pending, start, records), daemon=True)
+                   for records in per_thread]
+        for thread in threads:
+            thread.start()
+
+        for offset, payload in jobs:
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pending.put((offset, payload))
+
+        for _ in threads:
+            pending.put(None)
+        for thread in threads:
+            thread.join()
+
+        self.elapsed = time.monotonic() - start
+        self.records = sorted((r for records in per_thread for r in records), key=lambda r: r[0])
+        return self.records
+
+    def _produce(self, pending, start, records):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            offset, payload = item
+            actual = time.monotonic() - start
+            try:
+                label = self.send(payload)
+                ok = True
+            except Exception as e:
+                print(f"Error publishing task: {e}")
+                label, ok = None, False
+            records.append((offset, actual, time.monotonic() - start, label, ok))
+
+    def summary(self):
+        """Send-lag percentiles and offered versus achieved rate"""
+        if not self.records:
+            return {'tasks': 0}
+        lags = sorted(r[1] - r[0] for r in self.records)
+        span = self.records[-1][0] or 1.0
+
+        def pct(p):
+            return lags[min(len(lags) - 1, int(p / 100 * len(lags)))]
+        return {
+            'tasks': len(self.records),
+            'errors': sum(1 for r in self.records if not r[4]),
+            'offered_rate': len(self.records) / span,
+            'achieved_rate': len(self.records) / self.elapsed if self.elapsed else 0.0,
+            'lag_p50': pct(50),
+            'lag_p99': pct(99),
+            'lag_max': lags[-1]
+        }
+
+    def save(self, path):
+        """Write one CSV row per task: scheduled, sent and completed offsets"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['scheduled', 'sent', 'completed', 'task', 'ok'])
+            for scheduled, sent, completed, label, ok in self.records:
+                writer.writerow([f"{scheduled:.6f}", f"{sent:.6f}", f"{completed:.6f}", label, int(ok)])
@@ -1,35 +1,165 @@
+import os
 import time
+import socket
+import threading
+from collections import deque
 import psutil
-import redis
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import (
+    Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+)
 from flask import Flask, Response
 import json
+from queue_stats import QueueDepthCollector
+from redis_pool import BROKER_URL, client as redis_client
+
+# Set when prefork children write samples to shared files (see worker.py)
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
 
 # Prometheus metrics
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float('inf'))
 TASK_COUNTER = Counter('celery_tasks_total', 'Total number of tasks', ['task_type', 'status'])
-TASK_DURATION = Histogram('celery_task_duration_seconds', 'Task duration in seconds', ['task_type'])
-QUEUE_DEPTH = Gauge('celery_queue_depth', 'Number of tasks in queue')
-WORKER_CPU_USAGE = Gauge('celery_worker_cpu_percent', 'Worker CPU usage percentage')
-WORKER_MEMORY_USAGE = Gauge('celery_worker_memory_bytes', 'Worker memory usage in bytes')
-ACTIVE_WORKERS = Gauge('celery_active_workers', 'Number of active workers')
+TASK_DURATION = Histogram('celery_task_duration_seconds', 'Task duration in seconds', ['task_type'],
+                          buckets=LATENCY_BUCKETS)
+TASK_QUEUE_WAIT = Histogram('celery_task_queue_wait_seconds', 'Time from enqueue to task start', ['task_type'],
+                            buckets=LATENCY_BUCKETS)
+TASK_LATENCY = Histogram('celery_task_latency_seconds', 'Time from enqueue to task completion', ['task_type'],
+                         buckets=LATENCY_BUCKETS)
+# Gauges are only written by the worker's main process
+QUEUE_DEPTH = Gauge('celery_queue_depth', 'Number of tasks in queue', multiprocess_mode='livemax')
+QUEUE_LENGTH = Gauge('celery_queue_length', 'Number of ready messages per queue', ['queue'],
+                     multiprocess_mode='livemax')
+UNACKED_TASKS = Gauge('celery_unacked_tasks', 'Number of delivered but unacknowledged tasks',
+                      multiprocess_mode='livemax')
+WORKER_CPU_USAGE = Gauge('celery_worker_cpu_percent', 'Worker CPU usage percentage', multiprocess_mode='livemax')
+WORKER_MEMORY_USAGE = Gauge('celery_worker_memory_bytes', 'Worker memory usage in bytes',
+                            multiprocess_mode='livemax')
+ACTIVE_WORKERS = Gauge('celery_active_workers', 'Number of active workers', multiprocess_mode='livemax')
+
+# Seconds between rebuilds of the precomputed endpoint responses
+SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', 1.0))
+
+# Pod identity reported to the metrics adapter (labels come from the downward API)
+POD_NAME = os.getenv('POD_NAME', socket.gethostname())
+POD_LABELS_FILE = os.getenv('POD_LABELS_FILE', '/etc/podinfo/labels')
+
+def _pod_labels():
+    """Parse the downward API labels file (key="value" per line)"""
+    labels = {}
+    try:
+        with open(POD_LABELS_FILE) as f:
+            for line in f:
+                key, sep, value = line.strip().partition('=')
+                if sep:
+                    labels[key] = value.strip('"')
+    except OSError:
+        pass
+    return labels
+
+POD_LABELS = _pod_labels()
+
+def _memory_limit_bytes():
+    """Container memory limit from cgroups, falling back to host memory"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < psutil.virtual_memory().total:
+                return int(value)
+        except OSError:
+            continue
+    return psutil.virtual_memory().total
+
+class ResourceSampler:
+    """Background sampler of CPU and RSS for the worker process tree.
+
+    psutil.cpu_percent(interval=None) measures the time since the previous
+    call on the same Process object, so the objects are kept between samples
+    and readers only ever see the last published snapshot.
+    """
+
+    def __init__(self, pid=None, interval=None, window=30):
+        self.pid = pid or os.getpid()
+        self.interval = interval or float(os.getenv('RESOURCE_SAMPLE_INTERVAL', 2))
+        self.samples = deque(maxlen=window)
+        self.memory_limit = _memory_limit_bytes()
+        self.snapshot = {'cpu_percent': 0.0, 'cpu_percent_avg': 0.0, 'memory_used': 0,
+                         'memory_percent': 0.0, 'processes': 0, 'timestamp': 0}
+        self._processes = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the sampling thread if it is not already running"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Error sampling worker resources: {e}")
+            time.sleep(self.interval)
+
+    def _process_tree(self):
+        root = psutil.Process(self.pid)
+        return [root] + root.children(recursive=True)
+
+    def sample(self):
+        """Take one sample of the process tree and publish a new snapshot"""
+        cpu_percent = 0.0
+        memory_used = 0
+        processes = {}
+        for proc in self._process_tree():
+            cached = self._processes.get(proc.pid, proc)
+            try:
+                with cached.oneshot():
+                    cpu_percent += cached.cpu_percent(interval=None)
+                    memory_used += cached.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            processes[proc.pid] = cached
+        self._processes = processes
+
+        now = time.time()
+        self.samples.append((now, cpu_percent, memory_used))
+        self.snapshot = {
+            'cpu_percent': cpu_percent,
+            'cpu_percent_avg': sum(s[1] for s in self.samples) / len(self.samples),
+            'memory_used': memory_used,
+            'memory_percent': 100.0 * memory_used / self.memory_limit,
+            'processes': len(processes),
+            'timestamp': now
+        }
+        WORKER_CPU_USAGE.set(cpu_percent)
+        WORKER_MEMORY_USAGE.set(memory_used)
+        return self.snapshot
 
 class CeleryMetrics:
-    def __init__(self, redis_host='redis-service', redis_port=6379):
-        self.redis_client = redis.Redis(host=redis_host, port=redis_port, decode_responses=True)
+    def __init__(self, redis_url=BROKER_URL):
+        self.redis_client = redis_client(redis_url, decode_responses=True)
+        # Per-queue unacked counts let the adapter's pods mode honour queue selectors
+        self.depth_collector = QueueDepthCollector(self.redis_client, unacked_detail=True)
+        self.sampler = ResourceSampler()
         self.last_update = 0
         self.update_interval = 5  # Update metrics every 5 seconds
         
+    def get_queue_breakdown(self):
+        """Get per-queue depth from the broker in a single round trip"""
+        breakdown = self.depth_collector.collect()
+        for queue, depth in breakdown['queues'].items():
+            QUEUE_LENGTH.labels(queue=queue).set(depth)
+        UNACKED_TASKS.set(breakdown['unacked'])
+        QUEUE_DEPTH.set(breakdown['total'])
+        return breakdown
+    
     def get_queue_depth(self):
         """Get the current queue depth from Redis"""
         try:
-            # Get active, reserved, and scheduled tasks
-            active = len(self.redis_client.smembers('celery:active'))
-            reserved = len(self.redis_client.smembers('celery:reserved'))
-            scheduled = len(self.redis_client.zrange('celery:scheduled', 0, -1))
-            
-            total_depth = active + reserved + scheduled
-            QUEUE_DEPTH.set(total_depth)
-            return total_depth
+            return self.get_queue_breakdown()['total']
         except Exception as e:
             print(f"Error getting queue depth: {e}")
             return 0
@@ -38,32 +168,56 @@ class CeleryMetrics:
         """Get worker statistics"""
         try:
             # Get worker information from Redis
-            workers = self.redis_client.smembers('celery:workers')
-            active_workers = len(workers)
+            active_workers = self.redis_client.scard('celery:workers')
             ACTIVE_WORKERS.set(active_workers)
             
-            # Get system resource usage
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            
-            WORKER_CPU_USAGE.set(cpu_percent)
-            WORKER_MEMORY_USAGE.set(memory.used)
+            # Resource usage comes from the background sampler's latest snapshot
+            snapshot = self.sampler.start().snapshot
             
             return {
                 'active_workers': active_workers,
-                'cpu_percent': cpu_percent,
-                'memory_used': memory.used,
-                'memory_percent': memory.percent
+                'cpu_percent': snapshot['cpu_percent'],
+                'cpu_percent_avg': snapshot['cpu_percent_avg'],
+                'memory_used': snapshot['memory_used'],
+                'memory_percent': snapshot['memory_percent'],
+                'processes': snapshot['processes'],
+                'sampled_at': snapshot['timestamp']
             }
         except Exception as e:
             print(f"Error getting worker stats: {e}")
             return {'active_workers': 0, 'cpu_percent': 0, 'memory_used': 0, 'memory_percent': 0}
     
     def record_task_completion(self, task_type, duration, status='completed'):
-        """Record task completion metrics"""
-        TASK_COUNTER.labels(task_type=task_type, status=status).inc()
+        """Record task completion metrics; a status of None records only the duration"""
+        if status is not None:
+            TASK_COUNTER.labels(task_type=task_type, status=status).inc()
         TASK_DURATION.labels(task_type=task_type).observe(duration)
     
+    def record_task_event(self, task_type, status):
+        """Count a task lifecycle event such as received or failed"""
+        TASK_COUNTER.labels(task_type=task_type, status=status).inc()
+    
+    def record_queue_wait(self, task_type, seconds):
+        """Record time spent between enqueue and task start"""
+        TASK_QUEUE_WAIT.labels(task_type=task_type).observe(max(0.0, seconds))
+    
+    def record_end_to_end_latency(self, task_type, seconds):
+        """Record time spent between enqueue and task completion"""
+        TASK_LATENCY.labels(task_type=task_type).observe(max(0.0, seconds))
+    
+    def mark_process_dead(self, pid):
+        """Drop live-gauge files of an exited prefork child"""
+        if PROMETHEUS_MULTIPROC_DIR:
+            multiprocess.mark_process_dead(pid)
+    
+    def registry(self):
+        """Registry to expose, aggregating child processes in multiprocess mode"""
+        if not PROMETHEUS_MULTIPROC_DIR:
+            return REGISTRY
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    
     def get_metrics_summary(self):
         """Get a summary of all metrics for autoscaling decisions"""
         current_time = time.time()
@@ -87,12 +241,89 @@ class CeleryMetrics:
                 'queue_depth': QUEUE_DEPTH._value.get(),
                 'active_workers': ACTIVE_WORKERS._value.get(),
                 'cpu_percent': WORKER_CPU_USAGE._value.get(),
-                'memory_percent': WORKER_MEMORY_USAGE._value.get(),
+                'memory_percent': self.sampler.snapshot['memory_percent'],
                 'timestamp': self.last_update
             }
 
+class EndpointSnapshots:
+    """Endpoint responses rebuilt by one background thread.
+
+    Each refresh does the Redis round trips and serialization once; request
+    handlers only hand out the latest bytes, so probes and scrapes cost the
+    same no matter how many arrive together. /health turns unhealthy if the
+    refresher stops making progress.
+    """
+    
+    def __init__(self, metrics, interval=SNAPSHOT_INTERVAL):
+        self.metrics = metrics
+        self.interval = interval
+        self.responses = {}
+        self.updated = None
+        self.lock = threading.Lock()
+        self._thread = None
+    
+    def start(self):
+        """Start the refresh thread once; safe to call repeatedly"""
+        if self._thread is None:
+            self.refresh()
+            self._thread = threading.Thread(target=self._run, name='endpoint-snapshots', daemon=True)
+            self._thread.start()
+        return self
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing endpoint snapshots: {e}")
+    
+    def refresh(self):
+        with self.lock:
+            now = time.time()
+            responses = {}
+            try:
+                breakdown = self.metrics.get_queue_breakdown()
+                worker_stats = self.metrics.get_worker_stats()
+                responses['health'] = (json.dumps({
+                    'status': 'healthy',
+                    'queue_depth': breakdown['total'],
+                    'worker_stats': worker_stats,
+                    'timestamp': now
+                }), 200)
+                responses['queue-depth'] = (json.dumps({
+                    'queue_depth': breakdown['total'],
+                    'queues': breakdown['queues'],
+                    'unacked': breakdown['unacked'],
+                    'unacked_queues': breakdown['unacked_queues'],
+                    'pod': POD_NAME,
+                    'labels': POD_LABELS,
+                    'timestamp': now
+                }), 200)
+            except Exception as e:
+                responses['health'] = (json.dumps({'status': 'unhealthy', 'error': str(e)}), 500)
+                responses['queue-depth'] = (json.dumps({'error': str(e)}), 500)
+            responses['metrics'] = (generate_latest(self.metrics.registry()), 200)
+            self.responses = responses
+            self.updated = now
+    
+    def age(self):
+        return time.time() - self.updated if self.updated else None
+    
+    def response(self, name, mimetype='application/json'):
+        """Latest response for an endpoint, refreshing inline when no thread runs"""
+        age = self.age()
+        if age is None or (self._thread is None and age >= self.interval):
+            self.refresh()
+            age = self.age()
+        body, status = self.responses[name]
+        if name == 'health' and age > 3 * self.interval + 5:
+            body, status = json.dumps({'status': 'unhealthy', 'error': f"snapshot is {age:.0f}s old"}), 503
+        return Response(body, status=status, mimetype=mimetype, headers={'X-Metric-Age-Seconds': f"{age:.3f}"})
+
 # Global metrics instance
 metrics = CeleryMetrics()
+snapshots = EndpointSnapshots(metrics)
 
 # Flask app for metrics endpoint
 app = Flask(__name__)
@@ -100,32 +331,20 @@ app = Flask(__name__)
 @app.route('/metrics')
 def metrics_endpoint():
     """Prometheus metrics endpoint"""
-    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+    return snapshots.response('metrics', mimetype=CONTENT_TYPE_LATEST)
 
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    try:
-        queue_depth = metrics.get_queue_depth()
-        worker_stats = metrics.get_worker_stats()
-        
-        return {
-            'status': 'healthy',
-            'queue_depth': queue_depth,
-            'worker_stats': worker_stats,
-            'timestamp': time.time()
-        }
-    except Exception as e:
-        return {'status': 'unhealthy', 'error': str(e)}, 500
+    return snapshots.response('health')
 
 @app.route('/queue-depth')
 def queue_depth_endpoint():
     """Simple queue depth endpoint for autoscaling"""
-    try:
-        depth = metrics.get_queue_depth()
-        return {'queue_depth': depth, 'timestamp': time.time()}
-    except Exception as e:
-        return {'error': str(e)}, 500
+    return snapshots.response('queue-depth')
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000)
+    from serving import serve
+    metrics.sampler.start()
+    snapshots.start()
+    serve(app, 8000)
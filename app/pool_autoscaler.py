@@ -0,0 +1,193 @@
+"""
+Pool Autoscaler
+Grows and shrinks the prefork pool inside a worker pod within its CPU budget
+"""
+
+import os
+import math
+import time
+import psutil
+from celery.worker import state
+from celery.worker.autoscale import Autoscaler
+from prometheus_client import Counter, Gauge
+
+from metrics import POD_NAME
+from queue_stats import PoolCapacityRegistry
+from redis_pool import client as redis_client
+
+# Fraction of the container's CPU limit the pool may keep busy
+POOL_TARGET_CPU = float(os.getenv('POOL_TARGET_CPU', 0.9))
+# Minimum seconds between CPU usage readings (maybe_scale runs on every task message)
+POOL_CPU_SAMPLE_INTERVAL = float(os.getenv('POOL_CPU_SAMPLE_INTERVAL', 1.0))
+# Minimum seconds between capacity reports to Redis outside of scaling events
+POOL_PUBLISH_INTERVAL = float(os.getenv('POOL_PUBLISH_INTERVAL', 5.0))
+# Cores one process uses while running each task type, until measured otherwise
+TASK_CPU_SHARE = {'tasks.cpu_intensive': 1.0, 'tasks.io_bound': 0.1, 'tasks.mixed_task': 0.5}
+for _item in os.getenv('POOL_TASK_CPU_SHARE', '').split(','):
+    if '=' in _item:
+        _name, _share = _item.split('=', 1)
+        TASK_CPU_SHARE[_name.strip()] = float(_share)
+DEFAULT_CPU_SHARE = float(os.getenv('POOL_DEFAULT_CPU_SHARE', 1.0))
+
+POOL_PROCESSES = Gauge('celery_pool_processes', 'Prefork pool processes', multiprocess_mode='livemax')
+POOL_CAPACITY = Gauge('celery_pool_capacity', 'Pool processes the CPU budget allows for the current task mix',
+                      multiprocess_mode='livemax')
+POOL_SCALE_EVENTS = Counter('celery_pool_scale_events_total', 'In-pod pool resize events', ['direction'])
+
+
+def _cpu_limit_cores():
+    """Container CPU limit in cores from cgroups, falling back to the host's CPUs"""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return float(os.cpu_count() or 1)
+
+
+def _cgroup_cpu_seconds():
+    """CPU seconds used by the whole container, or None outside a cgroup"""
+    try:
+        with open('/sys/fs/cgroup/cpu.stat') as f:
+            for line in f:
+                key, value = line.split()
+                if key == 'usage_usec':
+                    return int(value) / 1e6
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpuacct/cpuacct.usage') as f:
+            return int(f.read()) / 1e9
+    except (OSError, ValueError):
+        return None
+
+
+def task_cpu_share(task_name):
+    return TASK_CPU_SHARE.get(task_name, DEFAULT_CPU_SHARE)
+
+
+class ResourceAwareAutoscaler(Autoscaler):
+    """Celery autoscaler sizing the pool by backlog and CPU headroom.
+
+    Celery's stock autoscaler wants one process per reserved request. This
+    one only starts processes for waiting requests while their expected CPU
+    share (by task type) fits in the unused part of the cgroup limit, and
+    sheds busy processes when measured usage runs over the target. Pool size
+    and capacity are exported to Prometheus and to Redis, where the metrics
+    adapter uses the capacity as per-pod concurrency for desired_workers.
+
+    Enabled with worker_autoscaler and --autoscale=max,min (see worker.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cpu_limit = _cpu_limit_cores()
+        self.capacity = self.max_concurrency
+        self.registry = PoolCapacityRegistry(redis_client())
+        self._cpu_used = 0.0
+        self._cpu_reading = None
+        self._published_at = 0
+        self._processes = {}
+
+    def _cpu_seconds(self):
+        seconds = _cgroup_cpu_seconds()
+        if seconds is not None:
+            return seconds
+        # No cgroup accounting: sum the pool's process tree instead
+        root = psutil.Process()
+        processes = {}
+        seconds = 0.0
+        for proc in [root] + root.children(recursive=True):
+            cached = self._processes.get(proc.pid, proc)
+            try:
+                times = cached.cpu_times()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            seconds += times.user + times.system
+            processes[proc.pid] = cached
+        self._processes = processes
+        return seconds
+
+    def cpu_used(self):
+        """Cores in use over the last sampling interval"""
+        now = time.monotonic()
+        if self._cpu_reading is None or now - self._cpu_reading[0] >= POOL_CPU_SAMPLE_INTERVAL:
+            seconds = self._cpu_seconds()
+            if self._cpu_reading is not None:
+                # Exited children drop out of the fallback sum, so clamp at zero
+                self._cpu_used = max(0.0, (seconds - self._cpu_reading[1]) / (now - self._cpu_reading[0]))
+            self._cpu_reading = (now, seconds)
+        return self._cpu_used
+
+    @property
+    def qty(self):
+        """Processes wanted now: busy ones plus the waiting tasks that fit the CPU budget"""
+        reserved = list(state.reserved_requests)
+        active = state.active_requests
+        busy = len(active)
+        budget = POOL_TARGET_CPU * self.cpu_limit
+        used = self.cpu_used()
+
+        shares = [task_cpu_share(req.name) for req in reserved]
+        mean_share = sum(shares) / len(shares) if shares else DEFAULT_CPU_SHARE
+        self.capacity = max(self.min_concurrency, min(self.max_concurrency,
+                                                      math.floor(budget / max(mean_share, 0.01))))
+
+        if used > budget and busy:
+            # Over budget: give back the processes accounting for the excess
+            per_process = used / busy
+            wanted = busy - math.ceil((used - budget) / per_process)
+        else:
+            wanted = busy
+            free = budget - used
+            for req in reserved:
+                if req in active:
+                    continue
+                share = task_cpu_share(req.name)
+                # Always let one task through when nothing is running
+                if share > free and wanted:
+                    break
+                free -= share
+                wanted += 1
+        self._publish()
+        return wanted
+
+    def _publish(self, force=False):
+        now = time.time()
+        if not force and now - self._published_at < POOL_PUBLISH_INTERVAL:
+            return
+        self._published_at = now
+        processes = self.processes
+        POOL_PROCESSES.set(processes)
+        POOL_CAPACITY.set(self.capacity)
+        try:
+            self.registry.publish(POD_NAME, processes, self.capacity, self.min_concurrency,
+                                  self.max_concurrency, now)
+        except Exception as e:
+            print(f"Error publishing pool capacity: {e}")
+
+    def _grow(self, n):
+        super()._grow(n)
+        POOL_SCALE_EVENTS.labels(direction='up').inc()
+        self._publish(force=True)
+
+    def _shrink(self, n):
+        super()._shrink(n)
+        POOL_SCALE_EVENTS.labels(direction='down').inc()
+        self._publish(force=True)
+
+    def info(self):
+        info = super().info()
+        info.update({'capacity': self.capacity, 'cpu_limit': self.cpu_limit, 'cpu_used': round(self._cpu_used, 3)})
+        return info
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Predictive Scaling Controller
+Forecasts task arrival rate and sizes the worker pool with Little's law
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+from collections import deque
+
+# Configuration
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 2))
+MIN_REPLICAS = int(os.getenv('MIN_REPLICAS', 2))
+MAX_REPLICAS = int(os.getenv('MAX_REPLICAS', 10))
+# How far ahead to size the pool, roughly pod startup plus HPA sync delay
+FORECAST_HORIZON = float(os.getenv('FORECAST_HORIZON', 60))
+# Time allowed to drain the backlog that is already queued
+DRAIN_SECONDS = float(os.getenv('DRAIN_SECONDS', 120))
+TARGET_UTILIZATION = float(os.getenv('TARGET_UTILIZATION', 0.8))
+
+
+# Per-second trend damping: a trend fades to phi^t of itself after t seconds,
+# so one sharp sample cannot be extrapolated linearly across the horizon
+TREND_DAMPING = float(os.getenv('TREND_DAMPING', 0.98))
+
+
+class HoltForecaster:
+    """Damped Holt (double exponential) smoothing over irregular samples.
+
+    The trend is kept per second so forecasts stay correct when the refresh
+    interval jitters, and decays by phi per second. With beta=0 it reduces
+    to a plain EWMA; with phi=1 it is Holt's linear method.
+    """
+
+    def __init__(self, alpha=0.5, beta=0.2, phi=TREND_DAMPING):
+        self.alpha = alpha
+        self.beta = beta
+        self.phi = phi
+        self.level = None
+        self.trend = 0.0
+
+    def _damped(self, seconds):
+        """Trend multiplier for seconds ahead: the sum of phi^t over 1..seconds"""
+        if self.phi >= 1:
+            return seconds
+        return self.phi * (1 - self.phi ** seconds) / (1 - self.phi)
+
+    def update(self, value, dt):
+        """Fold in an observation taken dt seconds after the previous one"""
+        if self.level is None:
+            self.level = value
+            return self.level
+        previous = self.level
+        predicted = self.level + self.trend * self._damped(dt)
+        self.level = self.alpha * value + (1 - self.alpha) * predicted
+        if dt > 0:
+            self.trend = (self.beta * (self.level - previous) / dt
+                          + (1 - self.beta) * self.trend * self.phi ** dt)
+        return self.level
+
+    def forecast(self, horizon):
+        """Forecast the value horizon seconds ahead (never negative)"""
+        if self.level is None:
+            return 0.0
+        return max(0.0, self.level + self.trend * self._damped(horizon))
+
+
+def littles_law_replicas(arrival_rate, service_time, concurrency, backlog=0,
+                         drain_seconds=DRAIN_SECONDS, utilization=TARGET_UTILIZATION):
+    """Replicas needed to keep up with arrivals and drain the current backlog.
+
+    By Little's law the steady-state number of busy slots is arrival rate x
+    mean service time. The backlog adds backlog x service time of work that
+    should finish within drain_seconds.
+    """
+    busy_slots = arrival_rate * service_time + backlog * service_time / drain_seconds
+    return math.ceil(busy_slots / (concurrency * utilization))
+
+
+class PredictiveScaler:
+    """Turns depth/completion counters into a desired replica count.
+
+    The forecast is floored at the mean arrival rate over the last horizon
+    seconds, so the pool shrinks only after load has stayed low for that
+    long, not after one low sample.
+    """
+
+    def __init__(self, concurrency=WORKER_CONCURRENCY, min_replicas=MIN_REPLICAS,
+                 max_replicas=MAX_REPLICAS, horizon=FORECAST_HORIZON, alpha=0.5, beta=0.2):
+        self.concurrency = concurrency
+        self.min_replicas = min_replicas
+        self.max_replicas = max_replicas
+        self.horizon = horizon
+        self.forecaster = HoltForecaster(alpha, beta)
+        # (timestamp, dt, arrival rate) of the samples inside the horizon
+        self.recent = deque()
+        self.last = None
+        self.arrival_rate = 0.0
+        self.completion_rate = 0.0
+        self.desired = min_replicas
+
+    def observe(self, timestamp, queue_depth, completed, service_time):
+        """Update with a sample of total depth and cumulative completions.
+
+        The dequeue rate is the change in completions; the arrival rate is the
+        dequeue rate plus the change in depth. Returns the desired replicas.
+        """
+        if self.last is not None:
+            last_ts, last_depth, last_completed = self.last
+            dt = timestamp - last_ts
+            if dt <= 0:
+                return self.desired
+            # Counters reset when Redis is flushed; treat that as no completions
+            self.completion_rate = max(0, completed - last_completed) / dt
+            self.arrival_rate = max(0.0, self.completion_rate + (queue_depth - last_depth) / dt)
+            self.forecaster.update(self.arrival_rate, dt)
+            self.recent.append((timestamp, dt, self.arrival_rate))
+            while self.recent and self.recent[0][0] <= timestamp - self.horizon:
+                self.recent.popleft()
+        self.last = (timestamp, queue_depth, completed)
+
+        forecast_rate = self.forecast_rate()
+        replicas = littles_law_replicas(forecast_rate, service_time, self.concurrency, backlog=queue_depth)
+        self.desired = min(self.max_replicas, max(self.min_replicas, replicas))
+        return self.desired
+
+    def recent_rate(self):
+        """Mean arrival rate over the samples of the last horizon seconds"""
+        seconds = sum(dt for _, dt, _ in self.recent)
+        if not seconds:
+            return 0.0
+        return sum(dt * rate for _, dt, rate in self.recent) / seconds
+
+    def forecast_rate(self):
+        """Arrival rate to size for: the forecast, but no less than the recent mean"""
+        return max(self.forecaster.forecast(self.horizon), self.recent_rate())
+
+    def state(self):
+        return {
+            'desired_workers': self.desired,
+            'concurrency': self.concurrency,
+            'arrival_rate': self.arrival_rate,
+            'completion_rate': self.completion_rate,
+            'forecast_rate': self.forecast_rate()
+        }
+
+
+def replay(samples, scaler=None):
+    """Run the controller over recorded samples and yield its decisions.
+
+    Each sample needs timestamp, queue_depth, completed and service_time.
+    """
+    scaler = scaler or PredictiveScaler()
+    for sample in samples:
+        scaler.observe(sample['timestamp'], sample['queue_depth'], sample['completed'], sample['service_time'])
+        yield dict(sample, **scaler.state())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded trace through the predictive scaler')
+    parser.add_argument('trace', help='NDJSON file with timestamp, queue_depth, completed, service_time')
+    parser.add_argument('--concurrency', type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument('--horizon', type=float, default=FORECAST_HORIZON)
+    parser.add_argument('--alpha', type=float, default=0.5)
+    parser.add_argument('--beta', type=float, default=0.2)
+    args = parser.parse_args()
+
+    scaler = PredictiveScaler(concurrency=args.concurrency, horizon=args.horizon,
+                              alpha=args.alpha, beta=args.beta)
+    with open(args.trace) as f:
+        samples = (json.loads(line) for line in f if line.strip())
+        for decision in replay(samples, scaler):
+            sys.stdout.write(json.dumps(decision) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Progress Reporting
+Throttled task progress updates for the result backend
+"""
+
+import os
+import time
+
+# Minimum seconds between two PROGRESS writes for the same task
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 0.5))
+
+
+class ProgressReporter:
+    """Coalesces update_state calls into at most one write per interval.
+
+    The first write is only due one interval after the task starts, so tasks
+    shorter than the interval never touch the result backend for progress;
+    their only write is the final result Celery stores when the task returns.
+    Payloads identical to the last one sent are skipped.
+    """
+
+    def __init__(self, task, total, min_interval=PROGRESS_INTERVAL, state='PROGRESS'):
+        self.task = task
+        self.total = total
+        self.min_interval = min_interval
+        self.state = state
+        self.writes = 0
+        self._last_meta = None
+        self._next_write = time.monotonic() + min_interval
+        # Eagerly applied or directly called tasks have no backend entry, and
+        # tasks whose result policy is not 'full' keep progress out of it
+        self.enabled = (not (task.request.called_directly or task.request.is_eager)
+                        and getattr(task, 'report_progress', True))
+
+    def update(self, current, **meta):
+        """Report progress, returning True if a write was actually sent"""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        if now < self._next_write:
+            return False
+        payload = {'current': current, 'total': self.total, **meta}
+        if payload == self._last_meta:
+            return False
+        self.task.update_state(state=self.state, meta=payload)
+        self._last_meta = payload
+        self._next_write = now + self.min_interval
+        self.writes += 1
+        return True
@@ -0,0 +1,239 @@
+"""
+Queue Statistics
+Broker-native queue depth collection using only Redis cardinality commands
+"""
+
+import os
+import json
+import time
+import threading
+
+# Kombu's Redis transport keeps one list per priority step; step 0 uses the
+# bare queue name and the others are suffixed with "\x06\x16<priority>".
+PRIORITY_SEP = '\x06\x16'
+PRIORITY_STEPS = [0, 3, 6, 9]
+
+# Hash of delivered-but-not-acknowledged messages (shared by all queues)
+UNACKED_KEY = 'unacked'
+
+# Hash of cumulative per-task runtime sums and counts written by the workers
+RUNTIME_KEY = 'celery:autoscaling:runtime'
+
+# Hash of per-pod pool sizes reported by the in-pod autoscaler
+POOL_KEY = 'celery:autoscaling:pool'
+
+# Queues the workers subscribe to (see task_routes in celery_app.py and WORKER_QUEUES in worker.py)
+DEFAULT_QUEUES = [q.strip() for q in os.getenv('CELERY_QUEUES', 'default,cpu,io').split(',') if q.strip()]
+
+
+def priority_keys(queue):
+    """Return the Redis list keys holding messages for a queue"""
+    return [queue if pri == 0 else f"{queue}{PRIORITY_SEP}{pri}" for pri in PRIORITY_STEPS]
+
+
+def _task_name(message):
+    """Extract the task name from a raw kombu message"""
+    try:
+        return json.loads(message)['headers']['task']
+    except (ValueError, KeyError, TypeError):
+        return 'unknown'
+
+
+def _unacked_origin(entry):
+    """(queue, task name) of an unacked hash value, stored as [message, exchange, routing_key]"""
+    try:
+        message, exchange, routing_key = json.loads(entry)
+        return routing_key or exchange or 'unknown', message['headers']['task']
+    except (ValueError, KeyError, TypeError):
+        return 'unknown', 'unknown'
+
+
+class QueueDepthCollector:
+    """Collects per-queue depth in a single pipelined round trip.
+
+    Only LLEN/HLEN are issued, so the cost is constant regardless of how
+    many messages are waiting. With a sample_size, the next messages to be
+    consumed from each list are also read (bounded LRANGE) to estimate how
+    the backlog splits across task names. With unacked_detail, the unacked
+    hash is read in full (it is bounded by prefetch limits, not by the
+    backlog) to attribute reserved and running tasks to their queue.
+    """
+
+    def __init__(self, redis_client, queues=None, sample_size=0, unacked_detail=False):
+        self.redis_client = redis_client
+        self.queues = list(queues or DEFAULT_QUEUES)
+        self.sample_size = sample_size
+        self.unacked_detail = unacked_detail
+
+    def collect(self):
+        """Return ready counts per queue and priority, unacked count and total"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for queue in self.queues:
+            for key in priority_keys(queue):
+                pipe.llen(key)
+                if self.sample_size:
+                    # Kombu pushes on the left and pops on the right
+                    pipe.lrange(key, -self.sample_size, -1)
+        if self.unacked_detail:
+            pipe.hvals(UNACKED_KEY)
+        else:
+            pipe.hlen(UNACKED_KEY)
+        replies = iter(pipe.execute())
+
+        queues = {}
+        by_priority = {}
+        tasks = {}
+        for queue in self.queues:
+            by_priority[queue] = {}
+            task_counts = {}
+            for pri in PRIORITY_STEPS:
+                length = int(next(replies) or 0)
+                by_priority[queue][pri] = length
+                if self.sample_size:
+                    sample = next(replies)
+                    if length and sample:
+                        scale = length / len(sample)
+                        for message in sample:
+                            name = _task_name(message)
+                            task_counts[name] = task_counts.get(name, 0) + scale
+            queues[queue] = sum(by_priority[queue].values())
+            if self.sample_size:
+                tasks[queue] = {name: round(count) for name, count in task_counts.items()}
+
+        unacked_queues = None
+        if self.unacked_detail:
+            unacked_queues = {}
+            entries = next(replies) or []
+            for entry in entries:
+                queue, name = _unacked_origin(entry)
+                per_task = unacked_queues.setdefault(queue, {})
+                per_task[name] = per_task.get(name, 0) + 1
+            unacked = len(entries)
+        else:
+            unacked = int(next(replies) or 0)
+        ready = sum(queues.values())
+        breakdown = {
+            'queues': queues,
+            'by_priority': by_priority,
+            'ready': ready,
+            'unacked': unacked,
+            'total': ready + unacked,
+        }
+        if self.sample_size:
+            breakdown['tasks'] = tasks
+        if unacked_queues is not None:
+            # {queue: {task name: count}} of delivered, not yet acknowledged messages
+            breakdown['unacked_queues'] = unacked_queues
+        return breakdown
+
+
+class TaskRuntimeStats:
+    """Cumulative per-task runtime counters shared by all workers through Redis.
+
+    Executions are summed in memory and written in one pipeline once
+    flush_every of them are pending or the oldest is flush_interval seconds
+    old, so recording is not a Redis round trip per task. Callers flush()
+    at process shutdown to write what is left.
+    """
+
+    def __init__(self, redis_client, flush_every=1, flush_interval=0):
+        self.redis_client = redis_client
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._pending_count = 0
+        self._first_pending = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def record(self, task_name, runtime):
+        """Add one completed execution of task_name"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: the parent's pending executions are not ours to write
+                self._pending, self._pending_count, self._first_pending = {}, 0, None
+                self._pid = os.getpid()
+            runtime_sum, count = self._pending.get(task_name, (0.0, 0))
+            self._pending[task_name] = (runtime_sum + runtime, count + 1)
+            self._pending_count += 1
+            now = time.monotonic()
+            if self._first_pending is None:
+                self._first_pending = now
+            if self._pending_count < self.flush_every and now - self._first_pending < self.flush_interval:
+                return
+            pending = self._take()
+        self._write(pending)
+
+    def flush(self):
+        """Write pending executions now"""
+        with self._lock:
+            pending = self._take()
+        self._write(pending)
+
+    def _take(self):
+        pending = self._pending
+        self._pending, self._pending_count, self._first_pending = {}, 0, None
+        return pending
+
+    def _write(self, pending):
+        if not pending:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for task_name, (runtime_sum, count) in pending.items():
+            pipe.hincrbyfloat(RUNTIME_KEY, f"{task_name}:sum", runtime_sum)
+            pipe.hincrby(RUNTIME_KEY, f"{task_name}:count", count)
+        pipe.execute()
+
+    def totals(self):
+        """Return {task_name: (runtime_sum, count)}"""
+        totals = {}
+        for field, value in self.redis_client.hgetall(RUNTIME_KEY).items():
+            if isinstance(field, bytes):
+                field, value = field.decode(), value.decode()
+            name, _, kind = field.rpartition(':')
+            runtime_sum, count = totals.get(name, (0.0, 0))
+            if kind == 'sum':
+                runtime_sum = float(value)
+            elif kind == 'count':
+                count = int(value)
+            totals[name] = (runtime_sum, count)
+        return totals
+
+
+class PoolCapacityRegistry:
+    """Per-pod pool size and capacity shared through Redis.
+
+    Written by pool_autoscaler.py in each worker, read by the metrics adapter.
+    Pods that go away leave their field behind, so readers ignore stale ones.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+
+    def publish(self, pod, processes, capacity, min_concurrency, max_concurrency, timestamp):
+        self.redis_client.hset(POOL_KEY, pod, json.dumps({
+            'processes': processes,
+            'capacity': capacity,
+            'min': min_concurrency,
+            'max': max_concurrency,
+            'timestamp': timestamp
+        }))
+
+    def pools(self, max_age, now):
+        """Return {pod: report} for reports newer than max_age seconds; stale ones are removed"""
+        pools, stale = {}, []
+        for pod, value in self.redis_client.hgetall(POOL_KEY).items():
+            if isinstance(pod, bytes):
+                pod, value = pod.decode(), value.decode()
+            try:
+                report = json.loads(value)
+            except ValueError:
+                stale.append(pod)
+                continue
+            if now - report.get('timestamp', 0) > max_age:
+                stale.append(pod)
+            else:
+                pools[pod] = report
+        if stale:
+            self.redis_client.hdel(POOL_KEY, *stale)
+        return pools
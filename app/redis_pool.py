@@ -0,0 +1,133 @@
+"""
+Redis Connections
+Shared connection pools and transport settings for the broker, result backend and metrics
+"""
+
+import os
+import socket
+import redis
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'redis-service')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+# Results live in their own database so result SCANs never walk the queue
+# keys and flushing results leaves the queues alone. Memory limits and
+# eviction are per instance: RESULT_BACKEND_URL can move results to another one.
+BROKER_REDIS_DB = int(os.getenv('BROKER_REDIS_DB', 0))
+RESULT_REDIS_DB = int(os.getenv('RESULT_REDIS_DB', 1))
+BROKER_URL = os.getenv('BROKER_URL') or f'redis://{REDIS_HOST}:{REDIS_PORT}/{BROKER_REDIS_DB}'
+RESULT_BACKEND_URL = os.getenv('RESULT_BACKEND_URL') or f'redis://{REDIS_HOST}:{REDIS_PORT}/{RESULT_REDIS_DB}'
+
+# Long enough to cover the broker's 1 second BRPOP and a slow pipelined read
+SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 30))
+SOCKET_CONNECT_TIMEOUT = float(os.getenv('REDIS_SOCKET_CONNECT_TIMEOUT', 5))
+# Idle pooled connections are PINGed before reuse after this many seconds, so
+# a connection dropped by Redis' timeout or a NAT is replaced instead of failing a task
+HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+# TCP keepalive: first probe after idle seconds, then every interval, dead after count misses
+KEEPALIVE_IDLE = int(os.getenv('REDIS_KEEPALIVE_IDLE', 60))
+KEEPALIVE_INTERVAL = int(os.getenv('REDIS_KEEPALIVE_INTERVAL', 10))
+KEEPALIVE_COUNT = int(os.getenv('REDIS_KEEPALIVE_COUNT', 3))
+# Connections per process for metrics, runtime stats and pool reports; callers
+# wait up to POOL_TIMEOUT seconds for a free one instead of opening more
+METRICS_MAX_CONNECTIONS = int(os.getenv('REDIS_METRICS_MAX_CONNECTIONS', 16))
+POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))
+# Connections a worker process keeps beyond one per execution slot: the
+# consumer, the remote control mailbox and a spare for publishing
+BROKER_HEADROOM = int(os.getenv('REDIS_BROKER_HEADROOM', 3))
+
+
+def _keepalive_options():
+    """TCP keepalive tuning, for the options this platform supports"""
+    options = {}
+    for name, value in (('TCP_KEEPIDLE', KEEPALIVE_IDLE), ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+                        ('TCP_KEEPCNT', KEEPALIVE_COUNT)):
+        if hasattr(socket, name):
+            options[getattr(socket, name)] = value
+    return options
+
+KEEPALIVE_OPTIONS = _keepalive_options()
+
+_pools = {}
+
+
+def connection_pool(url=None, decode_responses=False, max_connections=None):
+    """The process-wide pool for url, created on first use.
+
+    Pools block for a free connection rather than growing, and redis-py
+    resets them in forked children, so prefork children get their own.
+    """
+    url = url or BROKER_URL
+    key = (url, decode_responses)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = redis.BlockingConnectionPool.from_url(
+            url,
+            decode_responses=decode_responses,
+            max_connections=max_connections or METRICS_MAX_CONNECTIONS,
+            timeout=POOL_TIMEOUT,
+            socket_timeout=SOCKET_TIMEOUT,
+            socket_connect_timeout=SOCKET_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            socket_keepalive_options=KEEPALIVE_OPTIONS,
+            health_check_interval=HEALTH_CHECK_INTERVAL,
+            retry_on_timeout=True,
+        )
+    return pool
+
+
+def client(url=None, decode_responses=False):
+    """A Redis client sharing the process-wide pool for url (the broker by default)"""
+    return redis.Redis(connection_pool=connection_pool(url, decode_responses))
+
+
+def transport_settings():
+    """Celery settings for the broker and result backend connections"""
+    return {
+        'broker_url': BROKER_URL,
+        'result_backend': RESULT_BACKEND_URL,
+        'broker_transport_options': {
+            'socket_timeout': SOCKET_TIMEOUT,
+            'socket_connect_timeout': SOCKET_CONNECT_TIMEOUT,
+            'socket_keepalive': True,
+            'socket_keepalive_options': KEEPALIVE_OPTIONS,
+            'health_check_interval': HEALTH_CHECK_INTERVAL,
+            'retry_on_timeout': True,
+        },
+        # Keep retrying the broker at startup instead of crashing the pod
+        'broker_connection_retry_on_startup': True,
+        'redis_socket_timeout': SOCKET_TIMEOUT,
+        'redis_socket_connect_timeout': SOCKET_CONNECT_TIMEOUT,
+        'redis_socket_keepalive': True,
+        'redis_retry_on_timeout': True,
+        'redis_backend_health_check_interval': HEALTH_CHECK_INTERVAL,
+    }
+
+
+def pool_limits(pool, concurrency):
+    """Connection limits for one worker process, scaled to its execution slots.
+
+    Prefork children run one task at a time, so each process needs a single
+    backend connection; thread and green pools run concurrency tasks in one
+    process and need one each, or tasks queue behind each other for a socket.
+    """
+    slots = 1 if pool in ('prefork', 'solo') else concurrency
+    return {
+        # Producer connections kept open for publishing (Celery's default is 10)
+        'broker_pool_limit': slots + BROKER_HEADROOM,
+        # Per channel; acks and restores of unacked messages use it too
+        'broker_transport_options': dict(transport_settings()['broker_transport_options'],
+                                         max_connections=slots + BROKER_HEADROOM),
+        'redis_max_connections': slots + 1,
+    }
+
+
+def connections_per_pod(pool, concurrency):
+    """Upper bound of Redis connections one worker pod opens with these limits"""
+    limits = pool_limits(pool, concurrency)
+    backend = limits['redis_max_connections']
+    broker = limits['broker_transport_options']['max_connections']
+    if pool == 'prefork':
+        # Every child has its own backend pool plus one runtime-stats
+        # connection; the main process holds the consumer and metrics server
+        return concurrency * (backend + 1) + broker + METRICS_MAX_CONNECTIONS
+    return backend + broker + METRICS_MAX_CONNECTIONS
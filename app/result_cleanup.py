@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Result Backend Cleanup
+Expires, drops and compacts stored task results and reports the memory reclaimed
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from kombu.serialization import dumps, loads
+from redis.exceptions import ResponseError
+
+from celery_app import app
+from result_policy import RESULT_EXPIRES, result_policy, summarize
+from serialization import COMPACT_SERIALIZER, CONTENT_TYPE
+
+RESULT_PATTERN = 'celery-task-meta-*'
+# Keys handled per pipelined round trip
+CLEANUP_BATCH_SIZE = int(os.getenv('CLEANUP_BATCH_SIZE', 500))
+READY_STATES = {'SUCCESS', 'FAILURE', 'REVOKED'}
+# Result 'type' field -> task name, for entries stored without result_extended
+TYPE_TASKS = {'cpu_intensive': 'tasks.cpu_intensive', 'io_bound': 'tasks.io_bound', 'mixed': 'tasks.mixed_task'}
+
+
+def _decode(raw):
+    """Decode a stored result in whichever format it was written, returning (meta, serializer)"""
+    if raw[:1] == b'{':
+        return loads(raw, 'application/json', 'utf-8', accept={'application/json'}), 'json'
+    return loads(raw, CONTENT_TYPE, 'binary', accept={CONTENT_TYPE}), COMPACT_SERIALIZER
+
+
+def _task_name(meta):
+    if meta.get('name'):
+        return meta['name']
+    result = meta.get('result')
+    if isinstance(result, dict):
+        return TYPE_TASKS.get(result.get('type'))
+    return None
+
+
+class ResultCleaner:
+    """One pass over the result keys.
+
+    Keys written before result_expires was set never expire and get a TTL.
+    Finished results of 'ignore' tasks are deleted, and full results of
+    'summary' tasks are rewritten to their summary, keeping their TTL.
+    """
+
+    def __init__(self, client, expires=RESULT_EXPIRES, batch_size=CLEANUP_BATCH_SIZE, dry_run=False):
+        self.client = client
+        self.expires = expires
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self._memory_usage = True
+
+    def _sizes(self, keys):
+        """Bytes each key occupies, by MEMORY USAGE or, where unsupported, value length"""
+        if self._memory_usage:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.memory_usage(key)
+            try:
+                return [size or 0 for size in pipe.execute()]
+            except ResponseError:
+                self._memory_usage = False
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.strlen(key)
+        return [size + len(key) for size, key in zip(pipe.execute(), keys)]
+
+    def used_memory(self):
+        try:
+            return self.client.info('memory').get('used_memory')
+        except Exception:
+            return None
+
+    def _process(self, keys, report):
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.ttl(key)
+            pipe.get(key)
+        replies = pipe.execute()
+        sizes = self._sizes(keys)
+
+        pipe = self.client.pipeline(transaction=False)
+        rewritten = []
+        for key, ttl, raw, size in zip(keys, replies[::2], replies[1::2], sizes):
+            if raw is None:
+                continue
+            report['keys'] += 1
+            report['bytes_before'] += size
+            try:
+                meta, serializer = _decode(raw)
+            except Exception:
+                report['undecodable'] += 1
+                continue
+            state = meta.get('status')
+            report['states'][state] = report['states'].get(state, 0) + 1
+            policy = result_policy(_task_name(meta))
+            if state in READY_STATES and policy == 'ignore':
+                pipe.delete(key)
+                report['deleted'] += 1
+                report['bytes_reclaimed'] += size
+                continue
+            if state == 'SUCCESS' and policy == 'summary':
+                summary = summarize(meta.get('result'))
+                if summary != meta.get('result'):
+                    _, _, payload = dumps(dict(meta, result=summary), serializer=serializer)
+                    pipe.set(key, payload, keepttl=True)
+                    rewritten.append((key, size))
+                    report['compacted'] += 1
+                    if self.dry_run:
+                        # Nothing is rewritten to measure, so estimate from the value sizes
+                        report['bytes_reclaimed'] += len(raw) - len(payload)
+            if ttl == -1:
+                pipe.expire(key, self.expires)
+                report['expiry_added'] += 1
+        if not self.dry_run:
+            pipe.execute()
+            if rewritten:
+                report['bytes_reclaimed'] += (sum(size for _, size in rewritten)
+                                              - sum(self._sizes([key for key, _ in rewritten])))
+
+    def run(self):
+        """Scan every result key once; returns the report"""
+        report = {'keys': 0, 'states': {}, 'deleted': 0, 'compacted': 0, 'expiry_added': 0,
+                  'undecodable': 0, 'bytes_before': 0, 'bytes_reclaimed': 0, 'dry_run': self.dry_run}
+        started = time.monotonic()
+        report['used_memory_before'] = self.used_memory()
+        batch = []
+        for key in self.client.scan_iter(match=RESULT_PATTERN, count=self.batch_size):
+            batch.append(key)
+            if len(batch) >= self.batch_size:
+                self._process(batch, report)
+                batch = []
+        if batch:
+            self._process(batch, report)
+        report['used_memory_after'] = self.used_memory()
+        report['seconds'] = round(time.monotonic() - started, 3)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Expire and compact stored task results')
+    parser.add_argument('--expires', type=int, default=RESULT_EXPIRES, help='TTL given to results without one')
+    parser.add_argument('--batch-size', type=int, default=CLEANUP_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds instead of running once')
+    args = parser.parse_args()
+
+    cleaner = ResultCleaner(app.backend.client, expires=args.expires, batch_size=args.batch_size,
+                            dry_run=args.dry_run)
+    while True:
+        report = cleaner.run()
+        sys.stdout.write(json.dumps(report) + '\n')
+        sys.stdout.flush()
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Result Policies
+Per-task control over what each task leaves in the result backend
+"""
+
+import os
+from celery import Task
+
+# 'ignore' stores nothing, 'summary' stores a few timing fields once,
+# 'full' stores progress, STARTED and the whole return value
+POLICIES = ('ignore', 'summary', 'full')
+DEFAULT_POLICY = os.getenv('DEFAULT_RESULT_POLICY', 'full')
+# Seconds a stored result lives before Redis expires it
+RESULT_EXPIRES = int(os.getenv('RESULT_EXPIRES', 3600))
+# Fields kept by the summary policy (result_tracker.py needs started_at)
+SUMMARY_FIELDS = ('task_id', 'type', 'started_at', 'processing_time')
+
+
+def _parse_policies(text):
+    policies = {}
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        name, _, policy = item.partition('=')
+        policy = policy.strip()
+        if policy not in POLICIES:
+            raise ValueError(f"unknown result policy {policy!r} for {name.strip()}, "
+                             f"expected one of {', '.join(POLICIES)}")
+        policies[name.strip()] = policy
+    return policies
+
+# e.g. "tasks.io_bound=ignore,tasks.cpu_intensive=summary"
+RESULT_POLICIES = _parse_policies(os.getenv('RESULT_POLICIES', ''))
+
+
+def result_policy(task_name):
+    return RESULT_POLICIES.get(task_name, DEFAULT_POLICY)
+
+
+def summarize(result):
+    """The summary form of a task's return value"""
+    if isinstance(result, dict):
+        return {key: result[key] for key in SUMMARY_FIELDS if key in result}
+    return None
+
+
+def task_annotations(task_names):
+    """Celery task_annotations applying each task's policy.
+
+    ignore_result also stops the STARTED write, so only 'full' tasks keep
+    task_track_started.
+    """
+    annotations = {}
+    for name in task_names:
+        policy = result_policy(name)
+        if policy == 'ignore':
+            annotations[name] = {'ignore_result': True, 'track_started': False}
+        elif policy == 'summary':
+            annotations[name] = {'track_started': False}
+    return annotations
+
+
+class ResultPolicyTask(Task):
+    """Task base that trims the stored return value to the task's policy"""
+
+    @property
+    def report_progress(self):
+        return result_policy(self.name) == 'full'
+
+    def __call__(self, *args, **kwargs):
+        result = super().__call__(*args, **kwargs)
+        if result_policy(self.name) == 'summary':
+            return summarize(result)
+        return result
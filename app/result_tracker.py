@@ -0,0 +1,167 @@
+"""
+Result Tracker
+Follows submitted tasks through the result backend and reports latency percentiles
+"""
+
+import csv
+import json
+import time
+import threading
+from datetime import datetime, timezone
+
+READY_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def _timestamp(date_done):
+    """Epoch seconds from the backend's date_done (naive ISO strings are UTC)"""
+    if date_done is None:
+        return time.time()
+    if isinstance(date_done, str):
+        date_done = datetime.fromisoformat(date_done)
+    if date_done.tzinfo is None:
+        date_done = date_done.replace(tzinfo=timezone.utc)
+    return date_done.timestamp()
+
+
+class ResultTracker:
+    """Follows every task published while attached, without an AsyncResult.get() per task.
+
+    Task IDs are captured from the before_task_publish signal. A background
+    thread polls the still-pending IDs with chunked MGETs over the backend's
+    result keys, all in one pipeline round trip per poll, and keeps one
+    (task_name, enqueued_at, started_at, done_at, state) row per finished task.
+    Queue wait needs the started_at the tasks put in their result; latencies
+    compare submitter and worker wall clocks, so they assume synced clocks.
+    Tasks published with ignore_result (the 'ignore' result policy) never
+    write a result, so they are only counted per task name, not followed.
+    """
+
+    def __init__(self, backend, poll_interval=1.0, chunk_size=500):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+        self.pending = {}
+        self.finished = []
+        self.untracked = {}
+        self.lock = threading.Lock()
+        self.start = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self):
+        from celery.signals import before_task_publish
+        self.start = time.time()
+        before_task_publish.connect(self._on_publish, weak=False)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _on_publish(self, sender=None, headers=None, **kwargs):
+        if not headers or 'id' not in headers:
+            return
+        with self.lock:
+            if headers.get('ignore_result'):
+                self.untracked[sender] = self.untracked.get(sender, 0) + 1
+            else:
+                self.pending[headers['id']] = (sender, headers.get('enqueued_at', time.time()))
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling task results: {e}")
+
+    def poll(self):
+        """Fetch the results of pending tasks; returns how many finished"""
+        with self.lock:
+            task_ids = list(self.pending)
+        if not task_ids:
+            return 0
+
+        pipe = self.backend.client.pipeline(transaction=False)
+        for i in range(0, len(task_ids), self.chunk_size):
+            pipe.mget([self.backend.get_key_for_task(task_id) for task_id in task_ids[i:i + self.chunk_size]])
+        payloads = [payload for chunk in pipe.execute() for payload in chunk]
+
+        finished = []
+        for task_id, payload in zip(task_ids, payloads):
+            if payload is None:
+                continue
+            meta = self.backend.decode_result(payload)
+            if meta.get('status') not in READY_STATES:
+                continue
+            result = meta.get('result')
+            started_at = result.get('started_at') if isinstance(result, dict) else None
+            finished.append((task_id, meta['status'], started_at, _timestamp(meta.get('date_done'))))
+
+        with self.lock:
+            for task_id, state, started_at, done_at in finished:
+                task_name, enqueued_at = self.pending.pop(task_id)
+                self.finished.append((task_name, enqueued_at, started_at, done_at, state))
+        return len(finished)
+
+    def wait(self, timeout=300):
+        """Block until every tracked task finished or timeout seconds passed"""
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+        return not self.pending
+
+    def close(self):
+        from celery.signals import before_task_publish
+        before_task_publish.disconnect(self._on_publish)
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.poll()
+
+    def report(self):
+        """p50/p95/p99 queue wait and end-to-end latency per task type"""
+        by_type = {}
+        for task_name, enqueued_at, started_at, done_at, state in self.finished:
+            stats = by_type.setdefault(task_name, {'completed': 0, 'failed': 0, 'queue_wait': [], 'latency': []})
+            stats['completed' if state == 'SUCCESS' else 'failed'] += 1
+            stats['latency'].append(done_at - enqueued_at)
+            if started_at is not None:
+                stats['queue_wait'].append(started_at - enqueued_at)
+
+        report = {}
+        for task_name, stats in sorted(by_type.items()):
+            row = {'completed': stats['completed'], 'failed': stats['failed']}
+            for metric in ('queue_wait', 'latency'):
+                values = sorted(stats[metric])
+                for p in (50, 95, 99):
+                    row[f'{metric}_p{p}'] = percentile(values, p)
+            report[task_name] = row
+        return {'tasks': report, 'pending': len(self.pending), 'untracked': dict(self.untracked)}
+
+    def throughput(self, bucket_seconds=10):
+        """Completions per bucket as (offset, completed, failed, latency_p50) rows"""
+        buckets = {}
+        for task_name, enqueued_at, started_at, done_at, state in self.finished:
+            bucket = buckets.setdefault(int((done_at - self.start) // bucket_seconds), [0, 0, []])
+            bucket[0 if state == 'SUCCESS' else 1] += 1
+            bucket[2].append(done_at - enqueued_at)
+        return [(index * bucket_seconds, completed, failed, percentile(sorted(latencies), 50))
+                for index, (completed, failed, latencies) in sorted(buckets.items())]
+
+    def save(self, path, bucket_seconds=10):
+        """Write the throughput series as CSV and the percentile report next to it as JSON"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['offset_seconds', 'completed', 'failed', 'throughput_per_second', 'latency_p50'])
+            for offset, completed, failed, latency_p50 in self.throughput(bucket_seconds):
+                writer.writerow([offset, completed, failed, f"{completed / bucket_seconds:.3f}",
+                                 f"{latency_p50:.4f}"])
+        report_file = path.rsplit('.', 1)[0] + '.json'
+        with open(report_file, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        return report_file
@@ -0,0 +1,92 @@
+"""
+Compact Serialization
+msgpack serializer with size-gated compression for task messages and results
+"""
+
+import os
+import zlib
+import uuid
+import datetime
+from decimal import Decimal
+from kombu.serialization import register
+
+try:
+    import msgpack
+except ImportError:  # Without msgpack everything stays on JSON
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:  # lz4 is optional; zlib is always available
+    lz4 = None
+
+COMPACT_SERIALIZER = 'msgpackz'
+CONTENT_TYPE = 'application/x-msgpack-compressed'
+# 'zlib', 'lz4' or 'none'
+COMPRESSION = os.getenv('SERIALIZER_COMPRESSION', 'zlib')
+# Payloads smaller than this many bytes are stored uncompressed
+COMPRESS_THRESHOLD = int(os.getenv('SERIALIZER_COMPRESS_THRESHOLD', 1024))
+ZLIB_LEVEL = int(os.getenv('SERIALIZER_ZLIB_LEVEL', 6))
+
+# First byte of every payload says how the rest is stored
+RAW, ZLIB, LZ4 = b'\x00', b'\x01', b'\x02'
+
+
+def _default(obj):
+    """Encode the non-msgpack types kombu's JSON serializer also accepts"""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (uuid.UUID, Decimal)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"cannot serialize {type(obj).__name__}")
+
+
+def dumps(obj, compression=None, threshold=None):
+    """msgpack-encode obj, compressing it when it is large enough to pay off"""
+    compression = compression or COMPRESSION
+    threshold = COMPRESS_THRESHOLD if threshold is None else threshold
+    packed = msgpack.packb(obj, use_bin_type=True, default=_default)
+    if len(packed) >= threshold:
+        if compression == 'lz4' and lz4 is not None:
+            compressed = LZ4 + lz4.frame.compress(packed)
+        elif compression in ('zlib', 'lz4'):
+            compressed = ZLIB + zlib.compress(packed, ZLIB_LEVEL)
+        else:
+            compressed = None
+        # Keep the compressed form only if it is actually smaller
+        if compressed is not None and len(compressed) < len(packed) + 1:
+            return compressed
+    return RAW + packed
+
+
+def loads(data):
+    if isinstance(data, str):
+        data = data.encode('latin-1')
+    flag, payload = data[:1], data[1:]
+    if flag == ZLIB:
+        payload = zlib.decompress(payload)
+    elif flag == LZ4:
+        if lz4 is None:
+            raise ValueError("message is lz4-compressed but lz4 is not installed")
+        payload = lz4.frame.decompress(payload)
+    elif flag != RAW:
+        raise ValueError(f"unknown {COMPACT_SERIALIZER} payload flag {flag!r}")
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+def register_compact_serializer():
+    """Register the serializer with kombu; returns False when msgpack is missing"""
+    if msgpack is None:
+        return False
+    register(COMPACT_SERIALIZER, dumps, loads, content_type=CONTENT_TYPE, content_encoding='binary')
+    return True
+
+
+def serializer_setting(name, available):
+    """The serializer to configure for name, falling back to JSON if it is unavailable"""
+    if name == COMPACT_SERIALIZER and not available:
+        print(f"msgpack is not installed, using json instead of {COMPACT_SERIALIZER}")
+        return 'json'
+    return name
@@ -0,0 +1,40 @@
+"""
+HTTP Serving
+Production WSGI server for the metrics and adapter endpoints
+"""
+
+import os
+
+# 'waitress' serves with a bounded thread pool; 'development' is Flask's app.run
+SERVER_MODE = os.getenv('SERVER_MODE', 'waitress')
+# Requests handled concurrently; more connections wait in the server's queue
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', 8))
+SERVER_CONNECTION_LIMIT = int(os.getenv('SERVER_CONNECTION_LIMIT', 100))
+# Seconds an idle keep-alive connection is held open
+SERVER_CHANNEL_TIMEOUT = int(os.getenv('SERVER_CHANNEL_TIMEOUT', 120))
+
+
+def serve(app, port, host='0.0.0.0', mode=None, threads=SERVER_THREADS):
+    """Serve a WSGI app until the process exits.
+
+    waitress keeps HTTP/1.1 connections alive and runs handlers on a fixed
+    pool of threads, so a slow request occupies one thread instead of
+    stalling the accept loop. Falls back to Flask's threaded development
+    server when waitress is not installed.
+    """
+    mode = mode or SERVER_MODE
+    if mode == 'waitress':
+        try:
+            from waitress import serve as waitress_serve
+        except ImportError:
+            print("waitress is not installed, falling back to the development server")
+            mode = 'development'
+        else:
+            waitress_serve(app, host=host, port=port, threads=threads,
+                           connection_limit=SERVER_CONNECTION_LIMIT,
+                           channel_timeout=SERVER_CHANNEL_TIMEOUT,
+                           ident=None)
+            return
+    if mode != 'development':
+        raise ValueError(f"unknown server mode: {mode}")
+    app.run(host=host, port=port, debug=False, threaded=True)
@@ -7,56 +7,194 @@ Generates different task patterns to test autoscaling behavior
 import time
 import random
 import argparse
-import math
 import sys
 import os
+from contextlib import contextmanager
+from functools import partial
+import kombu
+from kombu.pools import ProducerPool
+from kombu.transport import redis as kombu_redis
 
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.celery_app import app, cpu_intensive_task, io_bound_task, mixed_task
+from app.load_generator import OpenLoopScheduler, arrival_times, gradual_rate, oscillating_rate
+from app.workload_trace import TraceRecorder, read_trace
+from app.result_tracker import ResultTracker
+from app.redis_pool import pool_limits
 
-def submit_gradual_increase(duration_minutes=10, max_tasks_per_minute=20):
+# Argument ranges per pattern: cpu complexity, io file_size, mixed (cpu, io)
+TASK_RANGES = {
+    'gradual': {'cpu': (500, 2000), 'io': (512, 2048), 'mixed': ((300, 1000), (256, 1024))},
+    'burst': {'cpu': (800, 2500), 'io': (1024, 4096), 'mixed': ((600, 1500), (512, 2048))},
+    'oscillating': {'cpu': (600, 1800), 'io': (768, 1536), 'mixed': ((400, 1200), (384, 1280))},
+}
+
+def random_task(pattern):
+    """Pick a random task type and its arguments from the pattern's ranges"""
+    ranges = TASK_RANGES[pattern]
+    task_type = random.choice(['cpu', 'io', 'mixed'])
+    
+    if task_type == 'cpu':
+        return cpu_intensive_task, {'complexity': random.randint(*ranges['cpu'])}
+    elif task_type == 'io':
+        return io_bound_task, {'file_size': random.randint(*ranges['io'])}
+    else:
+        cpu_range, io_range = ranges['mixed']
+        return mixed_task, {'cpu_complexity': random.randint(*cpu_range), 'io_size': random.randint(*io_range)}
+
+_MISSING = object()
+
+@contextmanager
+def patched(obj, name, value):
+    """Set an instance attribute for the duration of the block, then restore whatever was there"""
+    previous = obj.__dict__.get(name, _MISSING)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        if previous is _MISSING:
+            delattr(obj, name)
+        else:
+            setattr(obj, name, previous)
+
+@contextmanager
+def pipelined_publishes(producer):
+    """Buffer the producer's Redis LPUSHes into one non-transactional pipeline.
+
+    Kombu's Redis channel obtains a client per publish through
+    _create_client() (via conn_or_acquire() in _put()); handing it a
+    pipeline instead turns a batch of publishes into a single round trip
+    while kombu still does all message encoding and routing. Other
+    transports publish unchanged. These are kombu internals, so kombu is
+    pinned in requirements.txt and tests/test_task_submitter.py compares
+    the queued messages with plain apply_async publishes.
+    """
+    channel = producer.channel
+    if not isinstance(channel, kombu_redis.Channel):
+        yield None
+        return
+    if not callable(getattr(channel, '_create_client', None)) or not hasattr(channel, 'conn_or_acquire'):
+        raise RuntimeError(f"kombu {kombu.__version__} changed the Redis channel internals pipelined "
+                           f"publishing relies on; publish without --batch-size")
+    pipe = channel.client.pipeline(transaction=False)
+    with patched(channel, '_create_client', lambda *args, **kwargs: pipe):
+        yield pipe
+    pipe.execute()
+
+class BatchSubmitter:
+    """Publishes tasks in batches over one pooled producer.
+
+    Batches are released on absolute deadlines derived from the target rate,
+    so publish latency does not accumulate into rate drift.
+    """
+    
+    def __init__(self, batch_size=100, rate=None, pipeline=True):
+        self.batch_size = batch_size
+        self.rate = rate
+        self.pipeline = pipeline
+        self.published = 0
+        self.elapsed = 0.0
+    
+    def submit(self, tasks):
+        """Publish an iterable of (task, kwargs) pairs; returns the achieved rate"""
+        start = time.monotonic()
+        published = 0
+        # AsyncResults are discarded, so skip the result backend's per-task
+        # pubsub SUBSCRIBE; results are still stored by the workers
+        with patched(app.backend, 'on_task_call', lambda producer, task_id: None), \
+                app.producer_or_acquire() as producer:
+            batch = []
+            for item in tasks:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    published += self._publish(producer, batch, start, published)
+                    batch = []
+            if batch:
+                published += self._publish(producer, batch, start, published)
+        
+        self.elapsed = time.monotonic() - start
+        self.published = published
+        return self.achieved_rate()
+    
+    def _publish(self, producer, batch, start, published):
+        if self.rate:
+            delay = start + published / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if self.pipeline:
+            with pipelined_publishes(producer):
+                for task, kwargs in batch:
+                    task.apply_async(kwargs=kwargs, producer=producer)
+        else:
+            for task, kwargs in batch:
+                task.apply_async(kwargs=kwargs, producer=producer)
+        return len(batch)
+    
+    def achieved_rate(self):
+        return self.published / self.elapsed if self.elapsed else 0.0
+
+def _send(producers, payload):
+    task, kwargs = payload
+    with producers.acquire(block=True) as producer:
+        task.apply_async(kwargs=kwargs, producer=producer)
+    return task.name
+
+@contextmanager
+def producer_pool(size):
+    """A producer pool of its own for size sending threads, so sends never
+    wait for a free connection; app.conf and app.pool stay as they are."""
+    limits = pool_limits('threads', size)
+    connections = app.connection_for_write(transport_options=limits['broker_transport_options']).Pool(limit=size)
+    producers = ProducerPool(connections, limit=size, Producer=app.amqp.Producer)
+    try:
+        yield producers
+    finally:
+        producers.force_close_all()
+        connections.force_close_all()
+
+def pattern_jobs(pattern, rate_fn, duration_minutes, arrivals='constant'):
+    """Scheduled (offset, (task, kwargs)) jobs for a rate profile"""
+    schedule = arrival_times(rate_fn, duration_minutes * 60, process=arrivals)
+    return ((offset, random_task(pattern)) for offset in schedule)
+
+def run_open_loop(jobs, producers=4, send_log=None):
+    """Submit scheduled jobs open-loop and report how well the schedule was kept"""
+    # One producer connection per sending thread
+    with producer_pool(producers) as pool:
+        scheduler = OpenLoopScheduler(partial(_send, pool), producers=producers)
+        scheduler.run(jobs)
+    
+    summary = scheduler.summary()
+    if summary['tasks']:
+        print(f"Offered {summary['offered_rate']:.2f} tasks/s, achieved {summary['achieved_rate']:.2f} tasks/s; "
+              f"send lag p50={summary['lag_p50'] * 1000:.1f}ms p99={summary['lag_p99'] * 1000:.1f}ms "
+              f"max={summary['lag_max'] * 1000:.1f}ms, errors={summary['errors']}")
+    if send_log:
+        scheduler.save(send_log)
+        print(f"Send log written to {send_log}")
+    return scheduler
+
+def submit_gradual_increase(duration_minutes=10, max_tasks_per_minute=20, arrivals='constant',
+                            producers=4, send_log=None):
     """Submit tasks with gradual increase in frequency"""
     print(f"Starting gradual increase pattern for {duration_minutes} minutes...")
     
     start_time = time.time()
-    tasks_submitted = 0
-    
-    for minute in range(duration_minutes):
-        # Calculate tasks for this minute (gradually increasing)
-        tasks_this_minute = int((minute + 1) * max_tasks_per_minute / duration_minutes)
-        
-        print(f"Minute {minute + 1}: Submitting {tasks_this_minute} tasks")
-        
-        for _ in range(tasks_this_minute):
-            # Randomly choose task type
-            task_type = random.choice(['cpu', 'io', 'mixed'])
-            
-            if task_type == 'cpu':
-                complexity = random.randint(500, 2000)
-                task = cpu_intensive_task.delay(complexity=complexity)
-            elif task_type == 'io':
-                file_size = random.randint(512, 2048)
-                task = io_bound_task.delay(file_size=file_size)
-            else:
-                cpu_comp = random.randint(300, 1000)
-                io_size = random.randint(256, 1024)
-                task = mixed_task.delay(cpu_complexity=cpu_comp, io_size=io_size)
-            
-            tasks_submitted += 1
-            
-            # Small delay between task submissions
-            time.sleep(60 / tasks_this_minute)
-        
-        # Wait for next minute
-        time.sleep(60)
+    # Tasks per minute grow linearly; arrivals are scheduled on absolute deadlines
+    jobs = pattern_jobs('gradual', gradual_rate(duration_minutes, max_tasks_per_minute), duration_minutes, arrivals)
+    scheduler = run_open_loop(jobs, producers, send_log)
     
     elapsed_time = time.time() - start_time
-    print(f"Gradual increase completed: {tasks_submitted} tasks in {elapsed_time:.2f}s")
+    print(f"Gradual increase completed: {len(scheduler.records)} tasks in {elapsed_time:.2f}s")
 
-def submit_sudden_burst(burst_size=50, burst_count=3, delay_between_bursts=60):
-    """Submit tasks in sudden bursts"""
+def submit_sudden_burst(burst_size=50, burst_count=3, delay_between_bursts=60, batch_size=None, rate=None):
+    """Submit tasks in sudden bursts.
+    
+    With batch_size set, each burst is published through a BatchSubmitter
+    (optionally paced at rate tasks/s) instead of one .delay() per task.
+    """
     print(f"Starting sudden burst pattern: {burst_count} bursts of {burst_size} tasks each...")
     
     tasks_submitted = 0
@@ -66,25 +204,21 @@ def submit_sudden_burst(burst_size=50, burst_count=3, delay_between_bursts=60):
         
         burst_start = time.time()
         
-        for i in range(burst_size):
-            # Randomly choose task type
-            task_type = random.choice(['cpu', 'io', 'mixed'])
-            
-            if task_type == 'cpu':
-                complexity = random.randint(800, 2500)
-                task = cpu_intensive_task.delay(complexity=complexity)
-            elif task_type == 'io':
-                file_size = random.randint(1024, 4096)
-                task = io_bound_task.delay(file_size=file_size)
-            else:
-                cpu_comp = random.randint(600, 1500)
-                io_size = random.randint(512, 2048)
-                task = mixed_task.delay(cpu_complexity=cpu_comp, io_size=io_size)
-            
-            tasks_submitted += 1
-            
-            # Very small delay to prevent overwhelming
-            time.sleep(0.1)
+        if batch_size:
+            submitter = BatchSubmitter(batch_size=batch_size, rate=rate)
+            achieved = submitter.submit(random_task('burst') for _ in range(burst_size))
+            tasks_submitted += submitter.published
+            print(f"Burst {burst + 1}: published at {achieved:.0f} tasks/s")
+        else:
+            for i in range(burst_size):
+                # Randomly choose task type
+                task, kwargs = random_task('burst')
+                task.delay(**kwargs)
+                
+                tasks_submitted += 1
+                
+                # Very small delay to prevent overwhelming
+                time.sleep(0.1)
         
         burst_time = time.time() - burst_start
         print(f"Burst {burst + 1} completed in {burst_time:.2f}s")
@@ -95,53 +229,64 @@ def submit_sudden_burst(burst_size=50, burst_count=3, delay_between_bursts=60):
     
     print(f"Sudden burst completed: {tasks_submitted} tasks total")
 
-def submit_oscillating(duration_minutes=15, base_tasks_per_minute=10, amplitude=15):
+def submit_oscillating(duration_minutes=15, base_tasks_per_minute=10, amplitude=15, arrivals='constant',
+                       producers=4, send_log=None):
     """Submit tasks in oscillating pattern (sine wave)"""
     print(f"Starting oscillating pattern for {duration_minutes} minutes...")
     
     start_time = time.time()
-    tasks_submitted = 0
+    # Tasks per minute follow a sine wave between low and high rates
+    jobs = pattern_jobs('oscillating', oscillating_rate(duration_minutes, base_tasks_per_minute, amplitude),
+                        duration_minutes, arrivals)
+    scheduler = run_open_loop(jobs, producers, send_log)
     
-    for minute in range(duration_minutes):
-        # Calculate tasks using sine wave pattern
-        # This creates a smooth oscillation between low and high task rates
-        oscillation = math.sin(2 * math.pi * minute / (duration_minutes / 2))
-        tasks_this_minute = int(base_tasks_per_minute + amplitude * oscillation)
-        
-        # Ensure we don't have negative tasks
-        tasks_this_minute = max(1, tasks_this_minute)
-        
-        print(f"Minute {minute + 1}: Submitting {tasks_this_minute} tasks (oscillation: {oscillation:.2f})")
-        
-        for _ in range(tasks_this_minute):
-            # Randomly choose task type
-            task_type = random.choice(['cpu', 'io', 'mixed'])
-            
-            if task_type == 'cpu':
-                complexity = random.randint(600, 1800)
-                task = cpu_intensive_task.delay(complexity=complexity)
-            elif task_type == 'io':
-                file_size = random.randint(768, 1536)
-                task = io_bound_task.delay(file_size=file_size)
-            else:
-                cpu_comp = random.randint(400, 1200)
-                io_size = random.randint(384, 1280)
-                task = mixed_task.delay(cpu_complexity=cpu_comp, io_size=io_size)
-            
-            tasks_submitted += 1
-            
-            # Small delay between task submissions
-            time.sleep(60 / tasks_this_minute)
-        
-        # Wait for next minute
-        time.sleep(60)
+    elapsed_time = time.time() - start_time
+    print(f"Oscillating pattern completed: {len(scheduler.records)} tasks in {elapsed_time:.2f}s")
+
+def replay_trace(trace_file, speed=1.0, producers=4, batch_size=500, send_log=None):
+    """Replay a recorded trace at speed x, or as fast as possible when speed is 0"""
+    print(f"Replaying {trace_file} at {f'{speed}x' if speed else 'maximum'} speed...")
+    
+    start_time = time.time()
+    # Signatures carry each call's recorded args and kwargs; publishers merge in none
+    records = ((offset, app.signature(name, args=args, kwargs=kwargs))
+               for offset, name, args, kwargs in read_trace(trace_file))
+    if speed:
+        jobs = ((offset / speed, (signature, {})) for offset, signature in records)
+        tasks_submitted = len(run_open_loop(jobs, producers, send_log).records)
+    else:
+        submitter = BatchSubmitter(batch_size=batch_size)
+        achieved = submitter.submit((signature, {}) for _, signature in records)
+        tasks_submitted = submitter.published
+        print(f"Published at {achieved:.0f} tasks/s")
     
     elapsed_time = time.time() - start_time
-    print(f"Oscillating pattern completed: {tasks_submitted} tasks in {elapsed_time:.2f}s")
+    print(f"Replay completed: {tasks_submitted} tasks in {elapsed_time:.2f}s")
+
+def report_results(tracker, output_file, timeout):
+    """Wait for tracked tasks, then print and save their latency report"""
+    print(f"Waiting up to {timeout}s for {len(tracker.pending)} outstanding results...")
+    tracker.wait(timeout)
+    tracker.close()
+    
+    report = tracker.report()
+    for task_name, row in report['tasks'].items():
+        line = f"{task_name}: {row['completed']} completed, {row['failed']} failed"
+        for metric in ('queue_wait', 'latency'):
+            if row[f'{metric}_p50'] is not None:
+                line += (f"; {metric} p50={row[f'{metric}_p50']:.2f}s p95={row[f'{metric}_p95']:.2f}s "
+                         f"p99={row[f'{metric}_p99']:.2f}s")
+        print(line)
+    if report['pending']:
+        print(f"{report['pending']} tasks did not finish within {timeout}s")
+    for task_name, count in sorted(report['untracked'].items()):
+        print(f"{task_name}: {count} not tracked (results ignored by its result policy)")
+    report_file = tracker.save(output_file)
+    print(f"Throughput series written to {output_file}, latency report to {report_file}")
 
 def main():
     parser = argparse.ArgumentParser(description='Submit tasks to test autoscaling')
-    parser.add_argument('--pattern', choices=['gradual', 'burst', 'oscillating'], 
+    parser.add_argument('--pattern', choices=['gradual', 'burst', 'oscillating', 'replay'], 
                        default='gradual', help='Task submission pattern')
     parser.add_argument('--duration', type=int, default=10, 
                        help='Duration in minutes for gradual/oscillating patterns')
@@ -149,18 +294,61 @@ def main():
                        help='Number of tasks per burst')
     parser.add_argument('--burst-count', type=int, default=3, 
                        help='Number of bursts')
+    parser.add_argument('--batch-size', type=int, default=None,
+                       help='Publish bursts in pipelined batches of this size')
+    parser.add_argument('--rate', type=float, default=None,
+                       help='Target publish rate in tasks/s for batched bursts (default: unpaced)')
+    parser.add_argument('--arrivals', choices=['constant', 'poisson'], default='constant',
+                       help='Inter-arrival distribution for gradual/oscillating patterns')
+    parser.add_argument('--producers', type=int, default=4,
+                       help='Publisher threads for gradual/oscillating patterns')
+    parser.add_argument('--send-log', default=None,
+                       help='CSV file recording scheduled and actual send time of every task')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Seed for task choice and arrival times, for repeatable runs')
+    parser.add_argument('--record', default=None,
+                       help='Record every submitted task to this trace file')
+    parser.add_argument('--trace', default=None,
+                       help='Trace file to replay with --pattern replay')
+    parser.add_argument('--speed', type=float, default=1.0,
+                       help='Replay speed multiplier; 0 replays as fast as possible')
+    parser.add_argument('--track-results', default=None,
+                       help='Follow submitted tasks to completion and write a throughput CSV here')
+    parser.add_argument('--track-timeout', type=int, default=300,
+                       help='Seconds to wait for outstanding results after submission')
     
     args = parser.parse_args()
+    if args.pattern == 'replay' and not args.trace:
+        parser.error('--pattern replay requires --trace')
     
     print("Task Submitter for Celery Autoscaling Test")
     print("=" * 50)
     
-    if args.pattern == 'gradual':
-        submit_gradual_increase(args.duration)
-    elif args.pattern == 'burst':
-        submit_sudden_burst(args.burst_size, args.burst_count)
-    elif args.pattern == 'oscillating':
-        submit_oscillating(args.duration)
+    if args.seed is not None:
+        random.seed(args.seed)
+    recorder = TraceRecorder(args.record).attach() if args.record else None
+    tracker = ResultTracker(app.backend).attach() if args.track_results else None
+    
+    try:
+        if args.pattern == 'gradual':
+            submit_gradual_increase(args.duration, arrivals=args.arrivals, producers=args.producers,
+                                    send_log=args.send_log)
+        elif args.pattern == 'burst':
+            submit_sudden_burst(args.burst_size, args.burst_count, batch_size=args.batch_size, rate=args.rate)
+        elif args.pattern == 'oscillating':
+            submit_oscillating(args.duration, arrivals=args.arrivals, producers=args.producers,
+                               send_log=args.send_log)
+        elif args.pattern == 'replay':
+            replay_trace(args.trace, speed=args.speed, producers=args.producers,
+                         batch_size=args.batch_size or 500, send_log=args.send_log)
+    finally:
+        if recorder:
+            print(f"Recorded {recorder.close()} tasks to {args.record}")
+            if recorder.skipped:
+                print(f"Not recorded (unsupported arguments): {recorder.skipped}")
+    
+    if tracker:
+        report_results(tracker, args.track_results, args.track_timeout)
     
     print("Task submission completed!")
 
@@ -0,0 +1,67 @@
+"""
+Worker Tuning Profiles
+Prefetch, acknowledgement, scheduling and child recycling settings that are chosen together
+"""
+
+import os
+
+# Profile applied by celery_app.py and worker.py
+TUNING_PROFILE = os.getenv('TUNING_PROFILE', 'throughput')
+
+# Celery settings plus the worker's -O optimization for each profile.
+# With early acks a task stops counting against the prefetch limit once it
+# starts, so a pod holds its running tasks plus multiplier * concurrency
+# waiting ones. With late acks running tasks count too, and a multiplier of
+# 1 leaves nothing waiting that a newly scaled-up pod could have taken.
+PROFILES = {
+    # Celery's defaults: deep prefetch and no recycling, best for many short tasks
+    'throughput': {
+        'settings': {
+            'worker_prefetch_multiplier': 4,
+            'task_acks_late': False,
+            'task_reject_on_worker_lost': False,
+            'worker_max_tasks_per_child': None,
+        },
+        'optimization': 'default',
+    },
+    # One task waiting per process, handed to whichever child frees up first
+    'fair': {
+        'settings': {
+            'worker_prefetch_multiplier': 1,
+            'task_acks_late': False,
+            'task_reject_on_worker_lost': False,
+            'worker_max_tasks_per_child': 1000,
+        },
+        'optimization': 'fair',
+    },
+    # Nothing reserved beyond running tasks; long CPU tasks rebalance onto new pods
+    'latency': {
+        'settings': {
+            'worker_prefetch_multiplier': 1,
+            'task_acks_late': True,
+            # A child killed mid-task puts its message back on the queue
+            'task_reject_on_worker_lost': True,
+            'worker_max_tasks_per_child': 100,
+        },
+        'optimization': 'fair',
+    },
+}
+
+
+def get_profile(name=None):
+    """Return a profile by name, defaulting to TUNING_PROFILE"""
+    name = name or TUNING_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"unknown tuning profile {name!r}, expected one of {', '.join(PROFILES)}")
+
+
+def apply_profile(app, name=None):
+    """Update a Celery app's configuration with a profile's settings"""
+    app.conf.update(get_profile(name)['settings'])
+
+
+def worker_options(name=None):
+    """Worker command-line options a profile needs"""
+    return [f"--optimization={get_profile(name)['optimization']}"]
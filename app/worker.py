@@ -6,39 +6,93 @@ Starts Celery workers and integrates with metrics collection
 
 import os
 import sys
+import glob
 import time
 import threading
+
+# Prefork children write their samples to per-process files in this directory.
+# It has to be set (and emptied) before prometheus_client is first imported.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+for stale in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, '*.db')):
+    os.remove(stale)
+
+# 'embedded' serves metrics from a thread in this process; 'sidecar' leaves
+# that to exporter.py in its own container, reading the directory above
+METRICS_MODE = os.getenv('METRICS_MODE', 'embedded')
+
+# Queues consumed and pool type: 'prefork' for CPU work, 'threads' or 'gevent' for I/O
+WORKER_QUEUES = os.getenv('WORKER_QUEUES', 'default,cpu,io')
+WORKER_POOL = os.getenv('WORKER_POOL', 'prefork')
+if WORKER_POOL in ('gevent', 'eventlet'):
+    # Green pools must monkey-patch the standard library before Redis and Celery load
+    from celery import maybe_patch_concurrency
+    maybe_patch_concurrency(['worker', f'--pool={WORKER_POOL}'])
+
+# Fixed pool size, or bounds for the in-pod autoscaler when POOL_AUTOSCALE is on
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 2))
+POOL_AUTOSCALE = os.getenv('POOL_AUTOSCALE', 'false').lower() in ('1', 'true', 'yes')
+WORKER_MIN_CONCURRENCY = int(os.getenv('WORKER_MIN_CONCURRENCY', 2))
+WORKER_MAX_CONCURRENCY = int(os.getenv('WORKER_MAX_CONCURRENCY', 8))
+
 from celery import Celery
 from celery_app import app
-from metrics import metrics
+from metrics import metrics, snapshots
+from redis_pool import connections_per_pod, pool_limits
+from serving import serve
+from tuning import TUNING_PROFILE, worker_options
 
 def start_metrics_server():
     """Start the metrics server in a separate thread"""
     from metrics import app as metrics_app
-    metrics_app.run(host='0.0.0.0', port=8000, debug=False)
+    metrics.sampler.start()
+    snapshots.start()
+    serve(metrics_app, 8000)
 
 def main():
     """Main worker function"""
     print("Starting Celery Worker with Metrics Collection...")
     
-    # Start metrics server in background thread
-    metrics_thread = threading.Thread(target=start_metrics_server, daemon=True)
-    metrics_thread.start()
-    
-    print("Metrics server started on port 8000")
+    if METRICS_MODE == 'embedded':
+        # Start metrics server in background thread
+        metrics_thread = threading.Thread(target=start_metrics_server, daemon=True)
+        metrics_thread.start()
+        print("Metrics server started on port 8000")
+    else:
+        print("Metrics are served by the exporter sidecar")
     print("Worker starting...")
     
     # Start Celery worker
     argv = [
         'worker',
         '--loglevel=INFO',
-        '--concurrency=2',  # Start with 2 worker processes
         '--hostname=worker@%h',
-        '--queues=default',
+        f'--queues={WORKER_QUEUES}',
+        f'--pool={WORKER_POOL}',
         '--without-gossip',
-        '--without-mingle',
-        '--without-heartbeat'
+        '--without-mingle'
     ]
+    if POOL_AUTOSCALE and WORKER_POOL == 'prefork':
+        # Pool starts at the minimum and is resized by pool_autoscaler.py
+        app.conf.worker_autoscaler = 'pool_autoscaler:ResourceAwareAutoscaler'
+        argv.append(f'--autoscale={WORKER_MAX_CONCURRENCY},{WORKER_MIN_CONCURRENCY}')
+        print(f"Pool autoscaling between {WORKER_MIN_CONCURRENCY} and {WORKER_MAX_CONCURRENCY} processes")
+    else:
+        if POOL_AUTOSCALE:
+            print(f"Pool autoscaling needs the prefork pool, using {WORKER_CONCURRENCY} {WORKER_POOL} slots")
+        argv.append(f'--concurrency={WORKER_CONCURRENCY}')
+    # Connection pools sized for the largest pool this worker can reach
+    concurrency = WORKER_MAX_CONCURRENCY if POOL_AUTOSCALE and WORKER_POOL == 'prefork' else WORKER_CONCURRENCY
+    app.conf.update(pool_limits(WORKER_POOL, concurrency))
+    print(f"Redis connections: up to {connections_per_pod(WORKER_POOL, concurrency)} for this pod")
+    # Scheduling has to match the profile's prefetch and ack settings
+    argv.extend(worker_options(TUNING_PROFILE))
+    print(f"Tuning profile: {TUNING_PROFILE}")
+    if METRICS_MODE == 'sidecar':
+        # The exporter follows task events and the worker's own heartbeats
+        argv.append('--task-events')
+    else:
+        argv.append('--without-heartbeat')
     
     app.worker_main(argv)
 
@@ -0,0 +1,137 @@
+"""
+Workload Traces
+Compact binary record/replay format for task submission workloads
+"""
+
+import struct
+import threading
+import time
+import msgpack
+
+# File header: magic + format version
+MAGIC = b'CTRC'
+VERSION = 2
+HEADER = struct.Struct('<4sH')
+# One record per task: offset seconds and the length of a msgpack
+# [task name, args, kwargs] payload that follows
+RECORD = struct.Struct('<dI')
+
+# Version 1 records (offset, task type code, two integer arguments), still readable
+RECORD_V1 = struct.Struct('<dBII')
+TASK_TYPES_V1 = [
+    ('tasks.cpu_intensive', ('complexity', None)),
+    ('tasks.io_bound', ('file_size', None)),
+    ('tasks.mixed_task', ('cpu_complexity', 'io_size')),
+]
+
+
+def encode(offset, task_name, args, kwargs):
+    """Pack one submission into a record; raises TypeError for arguments msgpack cannot store"""
+    payload = msgpack.packb([task_name, list(args or ()), dict(kwargs or {})], use_bin_type=True)
+    return RECORD.pack(offset, len(payload)) + payload
+
+
+def _decode_v1(record):
+    offset, code, arg1, arg2 = record
+    name, (first, second) = TASK_TYPES_V1[code]
+    kwargs = {first: arg1}
+    if second:
+        kwargs[second] = arg2
+    return offset, name, [], kwargs
+
+
+class TraceWriter:
+    """Appends records to a trace file through a buffered writer"""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.count = 0
+
+    def write(self, offset, task_name, args, kwargs):
+        self.write_record(encode(offset, task_name, args, kwargs))
+
+    def write_record(self, record):
+        self.file.write(record)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_trace(path, chunk_records=4096):
+    """Lazily yield (offset, task_name, args, kwargs) from a trace file"""
+    with open(path, 'rb') as f:
+        magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"{path} is not a version 1 or {VERSION} task trace")
+        if version == 1:
+            while True:
+                chunk = f.read(RECORD_V1.size * chunk_records)
+                if not chunk:
+                    return
+                usable = len(chunk) - len(chunk) % RECORD_V1.size
+                for record in RECORD_V1.iter_unpack(chunk[:usable]):
+                    yield _decode_v1(record)
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            offset, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return  # truncated by an interrupted recording
+            task_name, args, kwargs = msgpack.unpackb(payload, raw=False, strict_map_key=False)
+            yield offset, task_name, args, kwargs
+
+
+class TraceRecorder:
+    """Records every task this process publishes, whatever code publishes it.
+
+    Hooks Celery's before_task_publish signal, so it captures the submitter
+    patterns as well as any production publisher it is attached to.
+    Offsets are measured on the monotonic clock from attach().
+    """
+
+    def __init__(self, path):
+        self.writer = TraceWriter(path)
+        self.lock = threading.Lock()
+        self.start = None
+        self.skipped = {}
+
+    def attach(self):
+        from celery.signals import before_task_publish
+        self.start = time.monotonic()
+        before_task_publish.connect(self._on_publish, weak=False)
+        return self
+
+    def _on_publish(self, sender=None, body=None, **kwargs):
+        # Task protocol 2 bodies are (args, kwargs, embed), protocol 1 bodies dicts
+        if isinstance(body, (tuple, list)):
+            task_args, task_kwargs = body[0], body[1]
+        else:
+            task_args, task_kwargs = body.get('args', ()), body.get('kwargs', {})
+        try:
+            record = encode(time.monotonic() - self.start, sender, task_args, task_kwargs)
+        except (TypeError, ValueError, OverflowError) as e:
+            # Never fail the publish itself; the task is left out of the trace
+            with self.lock:
+                if sender not in self.skipped:
+                    print(f"Not recording {sender} calls whose arguments msgpack cannot store: {e}")
+                self.skipped[sender] = self.skipped.get(sender, 0) + 1
+            return
+        with self.lock:
+            self.writer.write_record(record)
+
+    def close(self):
+        from celery.signals import before_task_publish
+        before_task_publish.disconnect(self._on_publish)
+        with self.lock:
+            self.writer.close()
+        return self.writer.count
@@ -0,0 +1,114 @@
+"""
+Workload Kernels
+Execution engines for the computation performed by the demo tasks
+"""
+
+import os
+import math
+import mmap
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# 'numpy' evaluates the series in vectorized chunks, 'python' element by element
+CPU_EXECUTION_MODE = os.getenv('CPU_EXECUTION_MODE', 'numpy' if np is not None else 'python')
+# Elements per vectorized chunk; bounds memory to a few arrays of this size
+CHUNK_SIZE = int(os.getenv('CPU_CHUNK_SIZE', 65536))
+# Lines formatted per writelines() call and bytes per read when verifying
+WRITE_BATCH_LINES = int(os.getenv('IO_WRITE_BATCH_LINES', 4096))
+READ_CHUNK_SIZE = int(os.getenv('IO_READ_CHUNK_SIZE', 1 << 20))
+# 'stream' counts newlines with buffered chunked reads, 'mmap' over a memory map
+IO_VERIFY_MODE = os.getenv('IO_VERIFY_MODE', 'stream')
+
+
+def resolve_mode(mode=None):
+    """Pick the execution mode, falling back to python when numpy is missing"""
+    mode = mode or CPU_EXECUTION_MODE
+    if mode not in ('numpy', 'python'):
+        raise ValueError(f"unknown execution mode: {mode}")
+    if mode == 'numpy' and np is None:
+        return 'python'
+    return mode
+
+
+def series_sum(n, with_cos=True, mode=None, chunk_size=CHUNK_SIZE, on_progress=None):
+    """Sum sqrt(i) * sin(i) [* cos(i)] for i in range(n).
+
+    on_progress(current, partial_result) is called every 100 elements in
+    python mode and once per chunk in numpy mode. Both modes agree to within
+    floating-point summation error (numpy sums each chunk pairwise).
+    """
+    if resolve_mode(mode) == 'numpy':
+        return _series_sum_numpy(n, with_cos, chunk_size, on_progress)
+    return _series_sum_python(n, with_cos, on_progress)
+
+
+def _series_sum_python(n, with_cos, on_progress):
+    result = 0
+    for i in range(n):
+        term = math.sqrt(i) * math.sin(i)
+        if with_cos:
+            term *= math.cos(i)
+        result += term
+        if on_progress is not None and i % 100 == 0:
+            on_progress(i, result)
+    return result
+
+
+def _series_sum_numpy(n, with_cos, chunk_size, on_progress):
+    result = 0.0
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        x = np.arange(start, stop, dtype=np.float64)
+        terms = np.sqrt(x)
+        terms *= np.sin(x)
+        if with_cos:
+            terms *= np.cos(x)
+        result += float(terms.sum())
+        if on_progress is not None:
+            on_progress(stop, result)
+    return result
+
+
+def write_lines(path, count, template, on_progress=None, batch_lines=WRITE_BATCH_LINES):
+    """Write template.format(i) for i in range(count) in large batches.
+
+    template must contain a single '{}' placeholder. Each batch is built
+    with one str.join over the line numbers and written in one call on a
+    1 MiB buffered file, so memory is bounded by the batch rather than by
+    count. on_progress(lines_written) is called after every batch.
+    """
+    prefix, suffix = template.split('{}', 1)
+    separator = suffix + prefix
+    with open(path, 'w', buffering=READ_CHUNK_SIZE) as f:
+        for start in range(0, count, batch_lines):
+            stop = min(start + batch_lines, count)
+            f.write(prefix + separator.join(map(str, range(start, stop))) + suffix)
+            if on_progress is not None:
+                on_progress(stop)
+
+
+def count_lines(path, mode=None, chunk_size=READ_CHUNK_SIZE):
+    """Count newlines without materializing the file's lines"""
+    mode = mode or IO_VERIFY_MODE
+    if mode not in ('stream', 'mmap'):
+        raise ValueError(f"unknown verify mode: {mode}")
+    lines = 0
+    with open(path, 'rb') as f:
+        if mode == 'mmap':
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start in range(0, size, chunk_size):
+                    lines += mm[start:start + chunk_size].count(b'\n')
+            return lines
+        buffer = bytearray(chunk_size)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            lines += buffer.count(b'\n', 0, n)
+    return lines
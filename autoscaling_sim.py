@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Autoscaling Simulator
+Discrete-event model of the task queue, worker pods and the HPA
+"""
+
+import os
+import sys
+import math
+import json
+import heapq
+import random
+import argparse
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.load_generator import arrival_times, gradual_rate, oscillating_rate
+from app.workload_trace import read_trace
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional; DEFAULT_HPA mirrors k8s/hpa.yaml
+    yaml = None
+
+HPA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'k8s', 'hpa.yaml')
+# The deployment whose HPA is simulated when a manifest holds several
+HPA_TARGET = 'celery-worker'
+
+# HPA settings in the shape load_hpa() returns, matching k8s/hpa.yaml
+DEFAULT_HPA = {
+    'metric': 'queue_depth',
+    'min_replicas': 2,
+    'max_replicas': 10,
+    'target': 5.0,
+    'tolerance': 0.1,
+    'sync_period': 15.0,
+    'scale_up': {'window': 60, 'select': 'Max', 'policies': [('Percent', 100, 15), ('Pods', 2, 15)]},
+    'scale_down': {'window': 300, 'select': 'Min', 'policies': [('Percent', 10, 60), ('Pods', 1, 60)]},
+}
+
+# Metrics the simulated HPA can scale on: the adapter's queue_depth and
+# backlog_seconds (AverageValue targets) and CPU (averageUtilization in percent)
+HPA_METRICS = ('queue_depth', 'backlog_seconds', 'cpu')
+
+# Kubernetes defaults for a behavior section that is left out
+DEFAULT_SCALE_UP = {'window': 0, 'select': 'Max', 'policies': [('Percent', 100, 15), ('Pods', 4, 15)]}
+DEFAULT_SCALE_DOWN = {'window': 300, 'select': 'Max', 'policies': [('Percent', 100, 15)]}
+
+TASK_TYPES = ['tasks.cpu_intensive', 'tasks.io_bound', 'tasks.mixed_task']
+# Mean service seconds per task type, drawn from a lognormal with this spread
+SERVICE_TIMES = {'tasks.cpu_intensive': 2.0, 'tasks.io_bound': 0.8, 'tasks.mixed_task': 1.5}
+SERVICE_SIGMA = 0.5
+# Share of a core a running task keeps busy, for the simulated CPU gauge
+CPU_SHARE = {'tasks.cpu_intensive': 1.0, 'tasks.io_bound': 0.2, 'tasks.mixed_task': 0.6}
+# End-to-end latency a task should finish within
+SLO_SECONDS = 30.0
+
+# Columns of every periodic sample, in metrics stream order
+SAMPLE_FIELDS = ['elapsed_seconds', 'queue_depth', 'active_workers', 'replicas', 'busy_slots', 'cpu_percent',
+                 'memory_percent', 'tasks_per_minute', 'latency_p50', 'latency_p95', 'latency_p99']
+
+
+def _behavior(spec, default):
+    if not spec:
+        return dict(default)
+    return {
+        'window': spec.get('stabilizationWindowSeconds', default['window']),
+        'select': spec.get('selectPolicy', 'Max'),
+        'policies': [(p['type'], p['value'], p['periodSeconds']) for p in spec.get('policies', [])]
+                    or default['policies']
+    }
+
+
+def load_hpa(path=HPA_FILE, target_name=HPA_TARGET):
+    """Read replica bounds, the first metric's target and behavior from an HPA manifest.
+
+    Manifests holding several HPAs use the one scaling target_name, or the first.
+    """
+    if yaml is None or not os.path.exists(path):
+        return dict(DEFAULT_HPA)
+    with open(path) as f:
+        documents = [doc for doc in yaml.safe_load_all(f) if doc]
+    matching = [doc for doc in documents if doc['spec'].get('scaleTargetRef', {}).get('name') == target_name]
+    spec = (matching or documents)[0]['spec']
+    metric_name, target = DEFAULT_HPA['metric'], DEFAULT_HPA['target']
+    for metric in spec.get('metrics', []):
+        source = metric.get(metric['type'].lower(), {})
+        metric_target = source.get('target', {})
+        if source.get('name') == 'cpu' and 'averageUtilization' in metric_target:
+            metric_name, target = 'cpu', float(metric_target['averageUtilization'])
+            break
+        if 'averageValue' in metric_target:
+            metric_name = source.get('metric', {}).get('name', metric_name)
+            target = float(metric_target['averageValue'])
+            break
+    behavior = spec.get('behavior', {})
+    return dict(DEFAULT_HPA,
+                metric=metric_name,
+                min_replicas=spec.get('minReplicas', 1),
+                max_replicas=spec['maxReplicas'],
+                target=target,
+                scale_up=_behavior(behavior.get('scaleUp'), DEFAULT_SCALE_UP),
+                scale_down=_behavior(behavior.get('scaleDown'), DEFAULT_SCALE_DOWN))
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def burst_times(burst_size=50, burst_count=3, delay_between_bursts=60, spacing=0.1):
+    """Arrival offsets of task_submitter's burst pattern"""
+    start = 0.0
+    for _ in range(burst_count):
+        for i in range(burst_size):
+            yield start + i * spacing
+        start += (burst_size - 1) * spacing + delay_between_bursts
+
+
+def pattern_arrivals(pattern, duration_minutes, rng, process='poisson', rate_scale=1.0):
+    """(offset, task_type) arrivals for a task_submitter pattern with a uniform task mix"""
+    if pattern == 'gradual':
+        base = gradual_rate(duration_minutes)
+    elif pattern == 'oscillating':
+        base = oscillating_rate(duration_minutes)
+    elif pattern == 'burst':
+        times = burst_times(burst_size=int(50 * rate_scale))
+        return ((t, rng.choice(TASK_TYPES)) for t in times)
+    else:
+        raise ValueError(f"unknown pattern: {pattern}")
+    times = arrival_times(lambda t: base(t) * rate_scale, duration_minutes * 60, process, rng)
+    return ((t, rng.choice(TASK_TYPES)) for t in times)
+
+
+def trace_arrivals(path, speed=1.0):
+    """(offset, task_type) arrivals from a recorded workload trace"""
+    return ((offset / speed, name) for offset, name, _, _ in read_trace(path))
+
+
+class Pod:
+    def __init__(self, ready_at):
+        self.ready_at = ready_at
+        self.busy = 0
+        self.draining = False
+
+
+class Simulation:
+    """Event-driven model of one queue served by an HPA-scaled worker Deployment.
+
+    Arrivals wait in a FIFO queue and are started on the first ready pod with
+    a free slot. Every sync period the HPA reads its metric: the ready queue
+    depth or its backlog seconds (as the metrics adapter serves them), or the
+    CPU utilization of ready pods averaged over the period. It computes the
+    desired replicas and applies the stabilization windows and rate-limit
+    policies the way the Kubernetes controller does. New pods serve only after startup_delay;
+    pods removed while busy stop taking tasks and exit once idle.
+    """
+
+    def __init__(self, hpa=None, concurrency=2, startup_delay=30.0, service_times=None,
+                 sample_interval=10.0, slo=SLO_SECONDS, seed=None):
+        self.hpa = hpa or load_hpa()
+        if self.hpa['metric'] not in HPA_METRICS:
+            raise ValueError(f"cannot simulate scaling on {self.hpa['metric']}")
+        self.concurrency = concurrency
+        self.startup_delay = startup_delay
+        self.service_times = service_times or SERVICE_TIMES
+        self.sample_interval = sample_interval
+        self.slo = slo
+        self.rng = random.Random(seed)
+
+    def _reset(self):
+        self.now = 0.0
+        self.events = []
+        self.seq = 0
+        self.queue = deque()
+        self.pods = [Pod(0.0) for _ in range(self.hpa['min_replicas'])]
+        self.cpu_load = 0.0
+        self.cpu_seconds = 0.0
+        self.cpu_mark = (0.0, 0.0)
+        self.backlog_seconds = 0.0
+        self.peak_pods = len(self.pods)
+        self.recommendations = []
+        self.scale_events = []
+        self.pod_seconds = 0.0
+        self.arrived = 0
+        self.queue_waits = {}
+        self.latencies = {}
+        self.interval_completions = 0
+        self.interval_latencies = []
+        self.samples = []
+        self.peak_queue_depth = 0
+        self.max_replicas = len(self.pods)
+
+    def _schedule(self, at, kind, data=None):
+        self.seq += 1
+        heapq.heappush(self.events, (at, self.seq, kind, data))
+
+    def _mean_service_time(self, task_type):
+        return self.service_times.get(task_type, 1.0)
+
+    def _service_time(self, task_type):
+        mean = self._mean_service_time(task_type)
+        return self.rng.lognormvariate(math.log(mean) - SERVICE_SIGMA ** 2 / 2, SERVICE_SIGMA)
+
+    def run(self, arrivals, duration, on_sample=None):
+        """Simulate duration seconds of (offset, task_type) arrivals; returns the summary.
+
+        Samples are collected in self.samples, or handed to on_sample(sample)
+        instead so long runs can stream them out without holding them.
+        """
+        self._reset()
+        self.on_sample = on_sample
+        arrivals = iter(arrivals)
+        pending = next(arrivals, None)
+        self._schedule(self.hpa['sync_period'], 'sync')
+        self._schedule(0.0, 'sample')
+
+        while True:
+            next_event = self.events[0][0] if self.events else math.inf
+            if pending is not None and pending[0] <= next_event:
+                at, kind, data = pending[0], 'arrival', pending[1]
+                pending = next(arrivals, None)
+            else:
+                at, _, kind, data = heapq.heappop(self.events)
+            if at > duration:
+                break
+            self.pod_seconds += len(self.pods) * (at - self.now)
+            self.cpu_seconds += self.cpu_load * (at - self.now)
+            self.now = at
+
+            if kind == 'arrival':
+                self.arrived += 1
+                self.queue.append((at, data))
+                self.backlog_seconds += self._mean_service_time(data)
+            elif kind == 'done':
+                self._complete(*data)
+            elif kind == 'sync':
+                self._sync()
+                self._schedule(at + self.hpa['sync_period'], 'sync')
+            elif kind == 'sample':
+                self._sample()
+                self._schedule(at + self.sample_interval, 'sample')
+            self._dispatch()
+
+        self.pod_seconds += len(self.pods) * (duration - self.now)
+        return self.summary(duration)
+
+    def _dispatch(self):
+        for pod in self.pods:
+            if not self.queue:
+                return
+            if pod.draining or pod.ready_at > self.now:
+                continue
+            while pod.busy < self.concurrency and self.queue:
+                arrived_at, task_type = self.queue.popleft()
+                self.backlog_seconds -= self._mean_service_time(task_type)
+                pod.busy += 1
+                self.cpu_load += CPU_SHARE.get(task_type, 1.0)
+                self.queue_waits.setdefault(task_type, []).append(self.now - arrived_at)
+                self._schedule(self.now + self._service_time(task_type), 'done', (pod, task_type, arrived_at))
+
+    def _complete(self, pod, task_type, arrived_at):
+        pod.busy -= 1
+        self.cpu_load -= CPU_SHARE.get(task_type, 1.0)
+        latency = self.now - arrived_at
+        self.latencies.setdefault(task_type, []).append(latency)
+        self.interval_completions += 1
+        self.interval_latencies.append(latency)
+        if pod.draining and pod.busy == 0:
+            self.pods.remove(pod)
+
+    def _sync(self):
+        current = sum(1 for pod in self.pods if not pod.draining)
+        target = self.hpa['target']
+        if self.hpa['metric'] == 'cpu':
+            # Utilization is averaged over ready pods, requests being one core per slot
+            ready = sum(1 for pod in self.pods if not pod.draining and pod.ready_at <= self.now)
+            since, cpu_seconds = self.cpu_mark
+            self.cpu_mark = (self.now, self.cpu_seconds)
+            capacity = max(1, ready * self.concurrency) * max(self.now - since, 1e-9)
+            ratio = 100.0 * (self.cpu_seconds - cpu_seconds) / capacity / target
+            desired = math.ceil(ratio * ready) if ready else current
+        else:
+            value = len(self.queue) if self.hpa['metric'] == 'queue_depth' else max(0.0, self.backlog_seconds)
+            ratio = value / (target * max(1, current))
+            desired = math.ceil(value / target)
+        if abs(ratio - 1) <= self.hpa['tolerance']:
+            desired = current
+        desired = self._stabilize(current, desired)
+        if desired != current:
+            self._scale(current, desired)
+
+    def _stabilize(self, current, desired):
+        """Stabilization windows, then the scale-up/scale-down rate limits"""
+        up, down = self.hpa['scale_up'], self.hpa['scale_down']
+        self.recommendations.append((self.now, desired))
+        horizon = self.now - max(up['window'], down['window'])
+        self.recommendations = [r for r in self.recommendations if r[0] >= horizon]
+        up_recommendation = min(r for t, r in self.recommendations if t >= self.now - up['window'])
+        down_recommendation = max(r for t, r in self.recommendations if t >= self.now - down['window'])
+
+        stabilized = current
+        if stabilized < up_recommendation:
+            stabilized = up_recommendation
+        if stabilized > down_recommendation:
+            stabilized = down_recommendation
+
+        if stabilized > current:
+            stabilized = min(stabilized, self._limit(current, up, 1))
+        elif stabilized < current:
+            stabilized = max(stabilized, self._limit(current, down, -1))
+        return min(self.hpa['max_replicas'], max(self.hpa['min_replicas'], stabilized))
+
+    def _limit(self, current, behavior, direction):
+        """Furthest replica count the policies allow in this direction"""
+        limits = []
+        for policy_type, value, period in behavior['policies']:
+            changed = sum(new - old for t, old, new in self.scale_events
+                          if t > self.now - period and (new - old) * direction > 0)
+            period_start = current - changed
+            if policy_type == 'Pods':
+                limits.append(period_start + direction * value)
+            else:
+                limits.append(math.ceil(period_start * (1 + direction * value / 100)))
+        if behavior['select'] == 'Disabled':
+            return current
+        # Max picks the policy allowing the largest change, Min the smallest
+        largest = max if direction > 0 else min
+        smallest = min if direction > 0 else max
+        return (largest if behavior['select'] == 'Max' else smallest)(limits)
+
+    def _scale(self, current, desired):
+        self.scale_events.append((self.now, current, desired))
+        if desired > current:
+            for _ in range(desired - current):
+                pod = Pod(self.now + self.startup_delay)
+                self.pods.append(pod)
+                self._schedule(pod.ready_at, 'ready')
+            self.peak_pods = max(self.peak_pods, len(self.pods))
+            return
+        # Remove pods that are still starting, then idle ones, then drain busy ones
+        active = [pod for pod in self.pods if not pod.draining]
+        victims = sorted(active, key=lambda pod: (pod.ready_at <= self.now, pod.busy, -pod.ready_at))
+        for pod in victims[:current - desired]:
+            if pod.busy:
+                pod.draining = True
+            else:
+                self.pods.remove(pod)
+
+    def _sample(self):
+        ready = [pod for pod in self.pods if not pod.draining and pod.ready_at <= self.now]
+        capacity = max(1, len(ready) * self.concurrency)
+        busy = sum(pod.busy for pod in self.pods)
+        latencies = sorted(self.interval_latencies)
+        sample = {
+            'elapsed_seconds': self.now,
+            'queue_depth': len(self.queue),
+            'active_workers': len(ready),
+            'replicas': sum(1 for pod in self.pods if not pod.draining),
+            'busy_slots': busy,
+            'cpu_percent': min(100.0, 100.0 * self.cpu_load / capacity),
+            # Modelled as a worker baseline plus a share per running task
+            'memory_percent': min(100.0, 30.0 + 40.0 * busy / capacity),
+            'tasks_per_minute': self.interval_completions * 60.0 / self.sample_interval,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_p99': percentile(latencies, 99)
+        }
+        self.peak_queue_depth = max(self.peak_queue_depth, sample['queue_depth'])
+        self.max_replicas = max(self.max_replicas, sample['replicas'])
+        if self.on_sample is not None:
+            self.on_sample(sample)
+        else:
+            self.samples.append(sample)
+        self.interval_completions = 0
+        self.interval_latencies = []
+
+    def summary(self, duration):
+        """Latency percentiles, cost in pod-hours and scaling activity"""
+        waits = sorted(w for values in self.queue_waits.values() for w in values)
+        latencies = sorted(l for values in self.latencies.values() for l in values)
+        # Tasks still queued past the SLO at the end count as violations too
+        violations = sum(1 for l in latencies if l > self.slo)
+        violations += sum(1 for arrived_at, _ in self.queue if duration - arrived_at > self.slo)
+        return {
+            'duration_seconds': duration,
+            'tasks_arrived': self.arrived,
+            'tasks_completed': len(latencies),
+            'backlog_at_end': len(self.queue),
+            'queue_wait_p50': percentile(waits, 50),
+            'queue_wait_p95': percentile(waits, 95),
+            'queue_wait_p99': percentile(waits, 99),
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_p99': percentile(latencies, 99),
+            'slo_seconds': self.slo,
+            'slo_violations': violations,
+            'pod_seconds': self.pod_seconds,
+            'pod_hours': self.pod_seconds / 3600,
+            'mean_pods': self.pod_seconds / duration if duration else 0.0,
+            'peak_pods': self.peak_pods,
+            'peak_queue_depth': self.peak_queue_depth,
+            'max_replicas': self.max_replicas,
+            'scale_events': len(self.scale_events),
+            'replica_changes': sum(abs(new - old) for _, old, new in self.scale_events)
+        }
+
+
+def build_parser(description='Simulate the queue and HPA offline'):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--pattern', choices=['gradual', 'burst', 'oscillating'], default='gradual')
+    parser.add_argument('--duration', type=float, default=10, help='Simulated minutes')
+    parser.add_argument('--rate-scale', type=float, default=1.0, help='Multiply the pattern arrival rate')
+    parser.add_argument('--arrivals', choices=['constant', 'poisson'], default='poisson')
+    parser.add_argument('--trace', default=None, help='Drive arrivals from a recorded workload trace')
+    parser.add_argument('--hpa-file', default=HPA_FILE)
+    parser.add_argument('--metric', choices=HPA_METRICS, default=None, help='Override the scaling metric')
+    parser.add_argument('--target', type=float, default=None,
+                        help='Override averageValue (averageUtilization percent for cpu)')
+    parser.add_argument('--min-replicas', type=int, default=None)
+    parser.add_argument('--max-replicas', type=int, default=None)
+    parser.add_argument('--scale-up-window', type=int, default=None)
+    parser.add_argument('--scale-down-window', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=2, help='Worker slots per pod')
+    parser.add_argument('--startup-delay', type=float, default=30.0, help='Seconds before a new pod serves')
+    parser.add_argument('--sample-interval', type=float, default=10.0)
+    parser.add_argument('--slo', type=float, default=SLO_SECONDS, help='Latency SLO in seconds')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+
+def simulation_from_args(args):
+    """Build the Simulation and its arrivals from build_parser() arguments"""
+    hpa = load_hpa(args.hpa_file)
+    for key, value in (('metric', args.metric), ('target', args.target), ('min_replicas', args.min_replicas),
+                       ('max_replicas', args.max_replicas)):
+        if value is not None:
+            hpa[key] = value
+    if args.scale_up_window is not None:
+        hpa['scale_up'] = dict(hpa['scale_up'], window=args.scale_up_window)
+    if args.scale_down_window is not None:
+        hpa['scale_down'] = dict(hpa['scale_down'], window=args.scale_down_window)
+
+    simulation = Simulation(hpa, concurrency=args.concurrency, startup_delay=args.startup_delay,
+                            sample_interval=args.sample_interval, slo=args.slo, seed=args.seed)
+    if args.trace:
+        arrivals = trace_arrivals(args.trace)
+    else:
+        arrivals = pattern_arrivals(args.pattern, args.duration, simulation.rng, args.arrivals, args.rate_scale)
+    return simulation, arrivals
+
+
+def main():
+    args = build_parser().parse_args()
+    simulation, arrivals = simulation_from_args(args)
+    summary = simulation.run(arrivals, args.duration * 60)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
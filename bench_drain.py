@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Drain Time Benchmark
+Simulates how each tuning profile drains a burst after an HPA scale-up
+"""
+
+import math
+import heapq
+import random
+import argparse
+from collections import deque
+
+from autoscaling_sim import SERVICE_SIGMA, SERVICE_TIMES, percentile
+from app.tuning import PROFILES
+
+
+class Child:
+    def __init__(self):
+        self.running = False
+        self.completed = 0
+        self.pipe = deque()  # tasks written to this child ahead of time (default scheduling)
+
+
+class Worker:
+    """One pod's consumer: a prefetch limit shared by its pool of children"""
+
+    def __init__(self, ready_at, concurrency, new):
+        self.ready_at = ready_at
+        self.children = [Child() for _ in range(concurrency)]
+        self.buffer = deque()  # reserved tasks not yet given to a child (fair scheduling)
+        self.new = new
+        self.started = 0
+
+
+class DrainModel:
+    """Event-driven model of Celery's prefetch, ack and scheduling rules.
+
+    A worker reserves messages while its unacked count is below
+    prefetch_multiplier * concurrency. Early acks happen when a task starts,
+    late acks when it finishes. With default scheduling a reserved task is
+    written to a child straight away (the least loaded one) and waits behind
+    that child's current task; with -O fair it goes to the first idle child.
+    Children are replaced after max_tasks_per_child tasks, which costs
+    restart_cost seconds.
+    """
+
+    def __init__(self, profile, concurrency=2, restart_cost=1.0, service_times=None, seed=0):
+        settings = PROFILES[profile]['settings']
+        self.prefetch_limit = settings['worker_prefetch_multiplier'] * concurrency
+        self.acks_late = settings['task_acks_late']
+        self.max_tasks_per_child = settings['worker_max_tasks_per_child']
+        self.fair = PROFILES[profile]['optimization'] == 'fair'
+        self.concurrency = concurrency
+        self.restart_cost = restart_cost
+        self.service_times = service_times or SERVICE_TIMES
+        self.rng = random.Random(seed)
+
+    def _service_time(self, task_type):
+        mean = self.service_times.get(task_type, 1.0)
+        return self.rng.lognormvariate(math.log(mean) - SERVICE_SIGMA ** 2 / 2, SERVICE_SIGMA)
+
+    def _schedule(self, at, kind, data):
+        self.seq += 1
+        heapq.heappush(self.events, (at, self.seq, kind, data))
+
+    def _unacked(self, worker):
+        waiting = len(worker.buffer) + sum(len(c.pipe) for c in worker.children)
+        if self.acks_late:
+            waiting += sum(c.running for c in worker.children)
+        return waiting
+
+    def _start(self, worker, child, task):
+        child.running = True
+        worker.started += 1
+        self._schedule(self.now + self._service_time(task[1]), 'done', (worker, child, task))
+
+    def _dispatch(self, worker):
+        for child in worker.children:
+            if child.running or child.completed is None:
+                continue
+            if child.pipe:
+                self._start(worker, child, child.pipe.popleft())
+            elif self.fair and worker.buffer:
+                self._start(worker, child, worker.buffer.popleft())
+
+    def _reserve(self, worker):
+        """Take messages off the shared queue up to the prefetch limit"""
+        while self.queue and self._unacked(worker) < self.prefetch_limit:
+            task = self.queue.popleft()
+            if self.fair:
+                worker.buffer.append(task)
+            else:
+                live = [c for c in worker.children if c.completed is not None]
+                child = min(live or worker.children, key=lambda c: c.running + len(c.pipe))
+                child.pipe.append(task)
+            self._dispatch(worker)
+
+    def run(self, tasks, initial_pods, target_pods, scale_up_delay):
+        """Drain tasks queued at t=0; returns (drain_seconds, latencies, share run on new pods)"""
+        self.now = 0.0
+        self.events = []
+        self.seq = 0
+        self.queue = deque((0.0, task_type) for task_type in tasks)
+        workers = [Worker(0.0, self.concurrency, new=False) for _ in range(initial_pods)]
+        workers += [Worker(scale_up_delay, self.concurrency, new=True) for _ in range(target_pods - initial_pods)]
+        for worker in workers:
+            self._schedule(worker.ready_at, 'ready', worker)
+
+        latencies = []
+        while self.events:
+            self.now, _, kind, data = heapq.heappop(self.events)
+            if kind == 'ready':
+                worker = data
+            elif kind == 'restarted':
+                worker, child = data
+                child.completed = 0
+            else:
+                worker, child, task = data
+                child.running = False
+                child.completed += 1
+                latencies.append(self.now - task[0])
+                if self.max_tasks_per_child and child.completed >= self.max_tasks_per_child:
+                    # The replacement child inherits whatever was written to the old one's pipe
+                    child.completed = None
+                    self._schedule(self.now + self.restart_cost, 'restarted', (worker, child))
+            # Early acks free prefetch room as tasks start, late acks as they finish
+            self._dispatch(worker)
+            self._reserve(worker)
+
+        latencies.sort()
+        new_share = sum(w.started for w in workers if w.new) / max(1, len(latencies))
+        return self.now, latencies, new_share
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare time-to-drain of the tuning profiles after a scale-up')
+    parser.add_argument('--tasks', type=int, default=200, help='Burst size queued at t=0')
+    parser.add_argument('--task-type', default='tasks.cpu_intensive', choices=sorted(SERVICE_TIMES))
+    parser.add_argument('--service-time', type=float, default=None,
+                        help='Mean task seconds (default: the simulator\'s mean for the task type)')
+    parser.add_argument('--initial-pods', type=int, default=2)
+    parser.add_argument('--target-pods', type=int, default=8, help='Replicas after the HPA scales up')
+    parser.add_argument('--scale-up-delay', type=float, default=45,
+                        help='Seconds until the new pods consume (HPA sync plus pod startup)')
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--restart-cost', type=float, default=1.0, help='Seconds to replace a recycled child')
+    parser.add_argument('--runs', type=int, default=20, help='Seeds averaged per profile')
+    args = parser.parse_args()
+    service_times = dict(SERVICE_TIMES)
+    if args.service_time:
+        service_times[args.task_type] = args.service_time
+
+    print(f"{args.tasks} x {args.task_type} ({service_times[args.task_type]:g}s) queued, "
+          f"{args.initial_pods} -> {args.target_pods} pods after {args.scale_up_delay:g}s, concurrency {args.concurrency}, {args.runs} runs")
+    print(f"\n{'profile':<12}{'drain (s)':>11}{'worst (s)':>11}{'p95 lat (s)':>13}{'on new pods':>13}")
+    for profile in PROFILES:
+        drains, p95s, shares = [], [], []
+        for seed in range(args.runs):
+            # The same seeds for every profile, so rows compare like for like
+            model = DrainModel(profile, args.concurrency, args.restart_cost, service_times, seed)
+            drain, latencies, new_share = model.run([args.task_type] * args.tasks, args.initial_pods,
+                                                    args.target_pods, args.scale_up_delay)
+            drains.append(drain)
+            p95s.append(percentile(latencies, 95))
+            shares.append(new_share)
+        print(f"{profile:<12}{sum(drains) / len(drains):>11.1f}{max(drains):>11.1f}"
+              f"{sum(p95s) / len(p95s):>13.1f}{100 * sum(shares) / len(shares):>12.0f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Endpoint Benchmark
+Measures requests/sec and tail latency of the metrics and adapter endpoints
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+
+# Module, WSGI app and startup calls for each server --serve can launch
+TARGETS = {
+    'metrics': ('metrics', 'app', 'metrics.metrics.sampler.start(); metrics.snapshots.start()', 8000,
+                ['/health', '/metrics', '/queue-depth']),
+    'adapter': ('custom_metrics_adapter', 'app', 'custom_metrics_adapter.adapter.start()', 8080,
+                ['/health', '/ready', '/apis/custom.metrics.k8s.io/v1beta1/namespaces/default/services/'
+                 'celery-worker-service/queue_depth']),
+}
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def hammer(url, deadline, keepalive, latencies, errors):
+    """Issue back-to-back GETs until the deadline, recording each latency"""
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    headers = {} if keepalive else {'Connection': 'close'}
+    conn = None
+    while time.monotonic() < deadline:
+        if conn is None:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = None
+        latencies.append(time.perf_counter() - start)
+        if conn is not None and not keepalive:
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def run(urls, concurrency, duration, keepalive=True):
+    """Hit every URL with concurrency clients at once; returns per-URL stats"""
+    deadline = time.monotonic() + duration
+    results = {url: ([], []) for url in urls}
+    threads = [threading.Thread(target=hammer, args=(url, deadline, keepalive, *results[url]), daemon=True)
+               for url in urls for _ in range(concurrency)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    stats = {}
+    for url, (latencies, errors) in results.items():
+        latencies.sort()
+        stats[url] = {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'rps': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+            'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+            'max_ms': latencies[-1] * 1000 if latencies else None
+        }
+    return stats
+
+
+def start_server(target, mode, port):
+    """Launch a target's server in its own process and wait until it accepts"""
+    module, wsgi, setup, _, _ = TARGETS[target]
+    code = (f"import {module}; {setup}; from serving import serve; "
+            f"serve({module}.{wsgi}, {port}, host='127.0.0.1', mode={mode!r})")
+    server = subprocess.Popen([sys.executable, '-c', code], cwd=APP_DIR,
+                              env=dict(os.environ, PYTHONPATH=APP_DIR),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError(f"{target} server exited with {server.returncode}")
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{target} server did not start on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the metrics endpoints under concurrent load')
+    parser.add_argument('--url', action='append', help='URL to load (repeatable); default: the target\'s endpoints')
+    parser.add_argument('--target', choices=TARGETS, default='metrics')
+    parser.add_argument('--serve', choices=['waitress', 'development'], action='append',
+                        help='Start the target locally with this server first (repeat to compare)')
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=16, help='Clients per URL')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per run')
+    parser.add_argument('--no-keepalive', action='store_true', help='Open a new connection per request')
+    args = parser.parse_args()
+
+    port = args.port or TARGETS[args.target][3]
+    urls = args.url or [f'http://127.0.0.1:{port}{path}' for path in TARGETS[args.target][4]]
+    print(f"{len(urls)} endpoints x {args.concurrency} clients for {args.duration:g}s, "
+          f"keep-alive {'off' if args.no_keepalive else 'on'}")
+
+    for mode in args.serve or [None]:
+        server = start_server(args.target, mode, port) if mode else None
+        try:
+            stats = run(urls, args.concurrency, args.duration, keepalive=not args.no_keepalive)
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+        print(f"\n{mode or 'external server'}")
+        print(f"{'endpoint':<48}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+        for url, row in stats.items():
+            path = urlsplit(url).path
+            if row['requests']:
+                print(f"{path[-48:]:<48}{row['rps']:>9.0f}{row['p50_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+                      f"{row['max_ms']:>9.1f}{row['errors']:>8}")
+            else:
+                print(f"{path[-48:]:<48}{'no responses':>36}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Serialization Benchmark
+Compares broker/backend bytes and encode/decode time per task type for each serializer
+"""
+
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import datetime
+from kombu.serialization import dumps, loads
+
+import app.serialization as serialization
+
+
+def task_message(name, kwargs):
+    """Celery protocol 2 headers and body for one task call"""
+    task_id = str(uuid.uuid4())
+    headers = {
+        'lang': 'py', 'task': name, 'id': task_id, 'shadow': None, 'eta': None, 'expires': None,
+        'group': None, 'group_index': None, 'retries': 0, 'timelimit': [300, 240], 'root_id': task_id,
+        'parent_id': None, 'argsrepr': '()', 'kwargsrepr': repr(kwargs), 'origin': 'gen1@submitter',
+        'ignore_result': False, 'enqueued_at': time.time()
+    }
+    body = ((), kwargs, {'callbacks': None, 'errbacks': None, 'chain': None, 'chord': None})
+    return headers, body
+
+
+def result_meta(task_id, result):
+    """Result backend entry as Celery's Redis backend stores it"""
+    return {'status': 'SUCCESS', 'result': result, 'traceback': None, 'children': [],
+            'date_done': datetime.datetime.utcnow().isoformat(), 'task_id': task_id}
+
+
+def workloads(rng):
+    """(label, task name, kwargs, result, progress meta) representative of each task type"""
+    started = time.time()
+    cpu = rng.randint(500, 2000)
+    io = rng.randint(512, 2048)
+    mixed = (rng.randint(300, 1000), rng.randint(256, 1024))
+    lines = [f"Line {i}: Some data for task {uuid.uuid4()}" for i in range(200)]
+    return [
+        ('tasks.cpu_intensive', 'tasks.cpu_intensive', {'complexity': cpu},
+         {'task_id': '', 'type': 'cpu_intensive', 'complexity': cpu, 'execution_mode': 'numpy',
+          'started_at': started, 'processing_time': rng.uniform(0.5, 4), 'result': rng.uniform(-1e6, 1e6)},
+         {'current': cpu // 2, 'total': cpu, 'result': rng.uniform(-1e6, 1e6)}),
+        ('tasks.io_bound', 'tasks.io_bound', {'file_size': io},
+         {'task_id': '', 'type': 'io_bound', 'file_size': io, 'started_at': started,
+          'processing_time': rng.uniform(0.2, 2), 'lines_processed': io},
+         {'current': io // 2, 'total': io, 'operation': 'writing'}),
+        ('tasks.mixed_task', 'tasks.mixed_task', {'cpu_complexity': mixed[0], 'io_size': mixed[1]},
+         {'task_id': '', 'type': 'mixed', 'cpu_complexity': mixed[0], 'io_size': mixed[1],
+          'execution_mode': 'numpy', 'started_at': started, 'processing_time': rng.uniform(0.5, 3),
+          'result': rng.uniform(-1e6, 1e6), 'lines_processed': mixed[1]},
+         {'current': mixed[0] // 2, 'total': mixed[0], 'operation': 'computing'}),
+        # Not a task in this repo: a result big enough to cross the compression threshold
+        ('large result (200 lines)', 'tasks.io_bound', {'file_size': 200},
+         {'task_id': '', 'type': 'io_bound', 'file_size': 200, 'started_at': started,
+          'processing_time': 0.1, 'lines': lines},
+         {'current': 100, 'total': 200, 'operation': 'writing'}),
+    ]
+
+
+def broker_bytes(headers, body, serializer):
+    """Size of the JSON envelope kombu's Redis transport stores for a message"""
+    content_type, content_encoding, payload = dumps(body, serializer=serializer)
+    if isinstance(payload, str):
+        payload = payload.encode(content_encoding)
+    envelope = {
+        'body': base64.b64encode(payload).decode(),
+        'content-encoding': content_encoding,
+        'content-type': content_type,
+        'headers': headers,
+        'properties': {'correlation_id': headers['id'], 'reply_to': str(uuid.uuid4()), 'delivery_mode': 2,
+                       'delivery_info': {'exchange': '', 'routing_key': 'default'}, 'priority': 0,
+                       'body_encoding': 'base64', 'delivery_tag': str(uuid.uuid4())}
+    }
+    return len(json.dumps(envelope))
+
+
+def roundtrip_seconds(objects, serializer, iterations):
+    """Mean seconds to encode and decode every object once"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for obj in objects:
+            content_type, content_encoding, payload = dumps(obj, serializer=serializer)
+            loads(payload, content_type, content_encoding)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare task serializers on representative payloads')
+    parser.add_argument('--iterations', type=int, default=2000, help='Round trips timed per row')
+    parser.add_argument('--threshold', type=int, default=serialization.COMPRESS_THRESHOLD,
+                        help='Compression threshold in bytes for msgpackz')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if not serialization.register_compact_serializer():
+        raise SystemExit("msgpack is not installed: pip install msgpack")
+    serialization.COMPRESS_THRESHOLD = args.threshold
+    serializers = [('json', 'json', None), ('msgpack', serialization.COMPACT_SERIALIZER, 'none'),
+                   ('msgpack+zlib', serialization.COMPACT_SERIALIZER, 'zlib')]
+    if serialization.lz4 is not None:
+        serializers.append(('msgpack+lz4', serialization.COMPACT_SERIALIZER, 'lz4'))
+
+    print(f"Compression above {args.threshold} bytes, {args.iterations} round trips per row")
+    print("Broker bytes: Redis list entry (JSON envelope, base64 body). Result bytes: backend value "
+          "for the final result; progress bytes: one PROGRESS update.")
+    print(f"\n{'task':<26}{'serializer':<14}{'broker B':>10}{'result B':>10}{'progress B':>12}{'us/task':>10}")
+    for label, name, kwargs, result, progress in workloads(random.Random(args.seed)):
+        headers, body = task_message(name, kwargs)
+        result['task_id'] = headers['id']
+        final = result_meta(headers['id'], result)
+        update = dict(result_meta(headers['id'], progress), status='PROGRESS')
+        for title, serializer, compression in serializers:
+            if compression:
+                serialization.COMPRESSION = compression
+            result_size = len(dumps(final, serializer=serializer)[2])
+            progress_size = len(dumps(update, serializer=serializer)[2])
+            seconds = roundtrip_seconds([body, final, update], serializer, args.iterations)
+            print(f"{label:<26}{title:<14}{broker_bytes(headers, body, serializer):>10}{result_size:>10}"
+                  f"{progress_size:>12}{seconds * 1e6:>10.1f}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -35,10 +35,12 @@ kubectl wait --for=condition=available --timeout=120s deployment/redis
 
 # Apply Celery worker deployment
 kubectl apply -f k8s/celery-worker-deployment.yaml
+kubectl apply -f k8s/celery-worker-io-deployment.yaml
 
 # Wait for Celery workers to be ready
 echo "Waiting for Celery workers to be ready..."
 kubectl wait --for=condition=available --timeout=120s deployment/celery-worker
+kubectl wait --for=condition=available --timeout=120s deployment/celery-worker-io
 
 # Apply custom metrics adapter
 kubectl apply -f k8s/custom-metrics-adapter.yaml
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Metrics Stream
+Append-only fixed-width storage for load-test samples
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; columns() falls back to lists
+    np = None
+
+# File preamble: magic, format version, length of the JSON header that follows
+MAGIC = b'CMET'
+VERSION = 1
+PREAMBLE = struct.Struct('<4sHI')
+# Seconds between flushes, bounding what a crash can lose
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1.0))
+
+
+class MetricsWriter:
+    """Appends samples as fixed-width rows of little-endian float64.
+
+    The JSON header names the columns and the wall-clock start time, so rows
+    carry numbers only and a file of N samples is exactly header + N rows.
+    Missing values are stored as NaN. The file is flushed at most every
+    flush_interval seconds; a crash loses at most that much, and a torn
+    last row is ignored by readers.
+    """
+
+    def __init__(self, path, fields, start_time=None, flush_interval=FLUSH_INTERVAL):
+        self.fields = list(fields)
+        self.record = struct.Struct(f'<{len(self.fields)}d')
+        self.flush_interval = flush_interval
+        self.count = 0
+        header = json.dumps({'fields': self.fields, 'start_time': start_time or time.time()}).encode()
+        self.file = open(path, 'wb')
+        self.file.write(PREAMBLE.pack(MAGIC, VERSION, len(header)) + header)
+        self.flush()
+
+    def append(self, sample):
+        values = (sample.get(field) for field in self.fields)
+        self.file.write(self.record.pack(*(math.nan if v is None else v for v in values)))
+        self.count += 1
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self._next_flush = time.monotonic() + self.flush_interval
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MetricsReader:
+    """Reads a metrics stream lazily row by row, or as memory-mapped columns"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, header_size = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} metrics stream")
+            header = json.loads(f.read(header_size))
+        self.fields = header['fields']
+        self.start_time = header['start_time']
+        self.record = struct.Struct(f'<{len(self.fields)}d')
+        self.data_offset = PREAMBLE.size + header_size
+
+    def __len__(self):
+        return (os.path.getsize(self.path) - self.data_offset) // self.record.size
+
+    def __iter__(self, chunk_records=4096):
+        """Yield samples as dicts, with NaN turned back into None"""
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset)
+            while True:
+                chunk = f.read(self.record.size * chunk_records)
+                usable = len(chunk) - len(chunk) % self.record.size
+                if not usable:
+                    return
+                for values in self.record.iter_unpack(chunk[:usable]):
+                    yield {field: None if math.isnan(v) else v for field, v in zip(self.fields, values)}
+
+    def columns(self, fields=None):
+        """Map field -> column; numpy memmap views when numpy is available"""
+        fields = fields or self.fields
+        rows = len(self)
+        if np is not None:
+            if rows == 0:
+                return {field: np.empty(0) for field in fields}
+            table = np.memmap(self.path, dtype='<f8', mode='r', offset=self.data_offset,
+                              shape=(rows, len(self.fields)))
+            return {field: table[:, self.fields.index(field)] for field in fields}
+        columns = {field: [] for field in fields}
+        for sample in self:
+            for field in fields:
+                columns[field].append(sample[field])
+        return columns
+
+
+def main():
+    """Print a metrics stream as NDJSON"""
+    if len(sys.argv) != 2:
+        sys.exit(f"usage: {sys.argv[0]} METRICS_FILE")
+    for sample in MetricsReader(sys.argv[1]):
+        sys.stdout.write(json.dumps(sample) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,65 +1,126 @@
 #!/usr/bin/env python3
 """
 Simple Metrics Plot
+Plots a load-test metrics stream, downsampled so long runs stay fast
 """
 
-import json
-import matplotlib.pyplot as plt
-from datetime import datetime
+import os
+import sys
+import argparse
+import matplotlib
 import numpy as np
 
-# Load data
-with open('quick_load_test_metrics.json', 'r') as f:
-    data = json.load(f)
-
-# Extract data
-seconds = [m['elapsed_seconds'] for m in data]
-queue_depth = [m['queue_depth'] for m in data]
-workers = [m['active_workers'] for m in data]
-cpu = [m['cpu_percent'] for m in data]
-memory = [m['memory_percent'] for m in data]
-
-# Create plot
-fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(12, 8))
-fig.suptitle('Celery Autoscaling - Load Test Results', fontsize=14, fontweight='bold')
-
-# Queue Depth
-ax1.plot(seconds, queue_depth, 'b-', linewidth=2, marker='o', markersize=4)
-ax1.set_title('Queue Depth Over Time')
-ax1.set_ylabel('Tasks in Queue')
-ax1.set_xlabel('Time (seconds)')
-ax1.grid(True, alpha=0.3)
-
-# Active Workers
-ax2.plot(seconds, workers, 'g-', linewidth=2, marker='s', markersize=4)
-ax2.set_title('Worker Scaling')
-ax2.set_ylabel('Number of Workers')
-ax2.set_xlabel('Time (seconds)')
-ax2.grid(True, alpha=0.3)
-
-# Resource Usage
-ax3.plot(seconds, cpu, 'r-', linewidth=2, label='CPU', marker='^', markersize=4)
-ax3.plot(seconds, memory, 'orange', linewidth=2, label='Memory', marker='v', markersize=4)
-ax3.set_title('Resource Utilization')
-ax3.set_ylabel('Percentage (%)')
-ax3.set_xlabel('Time (seconds)')
-ax3.grid(True, alpha=0.3)
-ax3.legend()
-
-# Combined View
-ax4.plot(seconds, queue_depth, 'b-', linewidth=2, label='Queue Depth')
-ax4.plot(seconds, [w*2 for w in workers], 'g--', linewidth=2, label='Workers × 2')
-ax4.set_title('Queue vs Workers')
-ax4.set_ylabel('Count')
-ax4.set_xlabel('Time (seconds)')
-ax4.grid(True, alpha=0.3)
-ax4.legend()
-
-plt.tight_layout()
-plt.savefig('autoscaling_graph.png', dpi=300, bbox_inches='tight')
-plt.show()
-
-print("📊 Graph saved as 'autoscaling_graph.png'")
-print(f"📈 Peak Queue Depth: {max(queue_depth)}")
-print(f"📈 Max Workers: {max(workers)}")
-print(f"📈 Peak CPU: {max(cpu):.1f}%")
+from metrics_stream import MetricsReader
+
+# Buckets per series; each keeps its min and max so spikes survive
+MAX_BUCKETS = 2000
+
+
+def downsample(x, y, buckets=MAX_BUCKETS):
+    """Min/max envelope of y over equal-count buckets of x.
+
+    Returns two points per bucket (the bucket minimum, then the maximum) at
+    the bucket's first x, so a line through them still shows every peak and
+    trough. NaN gaps are skipped with fmin/fmax; all-NaN buckets stay NaN.
+    """
+    if len(x) <= 2 * buckets:
+        return np.asarray(x), np.asarray(y)
+    starts = np.linspace(0, len(x), buckets, endpoint=False).astype(np.intp)
+    y = np.asarray(y)
+    lows = np.fmin.reduceat(y, starts)
+    highs = np.fmax.reduceat(y, starts)
+    return np.repeat(np.asarray(x)[starts], 2), np.column_stack((lows, highs)).ravel()
+
+
+def plot(ax, columns, field, *args, buckets=MAX_BUCKETS, **kwargs):
+    x, y = downsample(columns['elapsed_seconds'], columns[field], buckets)
+    return ax.plot(x, y, *args, linewidth=1, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plot a load-test metrics stream')
+    parser.add_argument('metrics_file', nargs='?', default='quick_load_test_metrics.bin')
+    parser.add_argument('--output', default='autoscaling_graph.png')
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--buckets', type=int, default=MAX_BUCKETS, help='Downsampling buckets per series')
+    parser.add_argument('--no-show', action='store_true', help='Only save the image')
+    args = parser.parse_args()
+
+    # Without a display there is nothing to show; render straight to file
+    headless = args.no_show or (sys.platform.startswith('linux') and not os.environ.get('DISPLAY'))
+    if headless:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    # Load data as memory-mapped numpy columns
+    reader = MetricsReader(args.metrics_file)
+    columns = reader.columns()
+    if len(reader) == 0:
+        sys.exit(f"No samples in {args.metrics_file}")
+    opts = {'buckets': args.buckets}
+
+    # Create plot
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(12, 8))
+    fig.suptitle('Celery Autoscaling - Load Test Results', fontsize=14, fontweight='bold')
+
+    # Queue Depth with replica count overlaid
+    plot(ax1, columns, 'queue_depth', 'b-', label='Queue Depth', **opts)
+    ax1.set_title('Queue Depth Over Time')
+    ax1.set_ylabel('Tasks in Queue')
+    ax1.set_xlabel('Time (seconds)')
+    ax1.grid(True, alpha=0.3)
+    if 'replicas' in columns:
+        replicas_axis = ax1.twinx()
+        plot(replicas_axis, columns, 'replicas', 'g--', label='Replicas', **opts)
+        replicas_axis.set_ylabel('Replicas')
+
+    # Active Workers
+    plot(ax2, columns, 'active_workers', 'g-', label='Ready', **opts)
+    if 'replicas' in columns:
+        plot(ax2, columns, 'replicas', 'k:', label='Desired', **opts)
+        ax2.legend()
+    ax2.set_title('Worker Scaling')
+    ax2.set_ylabel('Number of Workers')
+    ax2.set_xlabel('Time (seconds)')
+    ax2.grid(True, alpha=0.3)
+
+    # Resource Usage
+    plot(ax3, columns, 'cpu_percent', 'r-', label='CPU', **opts)
+    plot(ax3, columns, 'memory_percent', color='orange', label='Memory', **opts)
+    ax3.set_title('Resource Utilization')
+    ax3.set_ylabel('Percentage (%)')
+    ax3.set_xlabel('Time (seconds)')
+    ax3.grid(True, alpha=0.3)
+    ax3.legend()
+
+    # Latency percentiles against replicas
+    # Highest percentile first so the lower ones are drawn on top of it
+    for field, style in (('latency_p99', 'r-'), ('latency_p95', 'm-'), ('latency_p50', 'b-')):
+        if field in columns:
+            plot(ax4, columns, field, style, label=field.replace('latency_', ''), **opts)
+    ax4.set_title('Latency vs Replicas')
+    ax4.set_ylabel('Latency (seconds)')
+    ax4.set_xlabel('Time (seconds)')
+    ax4.grid(True, alpha=0.3)
+    if 'replicas' in columns:
+        replicas_axis = ax4.twinx()
+        plot(replicas_axis, columns, 'replicas', 'g--', label='Replicas', **opts)
+        replicas_axis.set_ylabel('Replicas')
+    if ax4.lines:
+        ax4.legend(loc='upper left')
+
+    plt.tight_layout()
+    plt.savefig(args.output, dpi=args.dpi, bbox_inches='tight')
+    if not headless:
+        plt.show()
+
+    print(f"📊 Graph saved as '{args.output}'")
+    print(f"📈 Peak Queue Depth: {np.nanmax(columns['queue_depth']):.0f}")
+    print(f"📈 Max Workers: {np.nanmax(columns['active_workers']):.0f}")
+    print(f"📈 Peak CPU: {np.nanmax(columns['cpu_percent']):.1f}%")
+    if 'latency_p99' in columns and not np.isnan(columns['latency_p99']).all():
+        print(f"📈 Peak p99 Latency: {np.nanmax(columns['latency_p99']):.1f}s")
+
+
+if __name__ == '__main__':
+    main()
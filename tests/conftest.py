@@ -0,0 +1,8 @@
+"""Tests import the app modules the way the worker does (flat, from app/)
+and the scripts do (app.<module>, from the repository root)"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'app'), ROOT]
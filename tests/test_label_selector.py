@@ -0,0 +1,65 @@
+"""Label selector grammar used by metricLabelSelector queries"""
+
+import pytest
+
+from custom_metrics_adapter import matches_selector, parse_selector
+
+CPU = {'queue': 'cpu', 'task': 'tasks.cpu_intensive'}
+IO = {'queue': 'io', 'task': 'tasks.io_bound'}
+UNLABELLED = {}
+
+
+def select(text, *series):
+    terms = parse_selector(text)
+    return [labels for labels in series if matches_selector(labels, terms)]
+
+
+def test_empty_selector_matches_everything():
+    assert parse_selector('') == []
+    assert parse_selector(None) == []
+    assert select('', CPU, IO, UNLABELLED) == [CPU, IO, UNLABELLED]
+
+
+@pytest.mark.parametrize('text', ['queue=cpu', 'queue==cpu', ' queue = cpu '])
+def test_equality(text):
+    assert select(text, CPU, IO, UNLABELLED) == [CPU]
+
+
+def test_inequality_matches_missing_label():
+    assert select('queue!=cpu', CPU, IO, UNLABELLED) == [IO, UNLABELLED]
+
+
+def test_in_and_notin():
+    assert select('queue in (cpu, io)', CPU, IO, UNLABELLED) == [CPU, IO]
+    assert select('queue in (cpu)', CPU, IO, UNLABELLED) == [CPU]
+    # notin, like !=, also matches series without the label
+    assert select('queue notin (cpu)', CPU, IO, UNLABELLED) == [IO, UNLABELLED]
+    assert select('task notin (tasks.cpu_intensive,tasks.io_bound)', CPU, IO, UNLABELLED) == [UNLABELLED]
+
+
+def test_commas_inside_sets_do_not_split_terms():
+    assert parse_selector('queue in (cpu,io),task!=tasks.io_bound') == [
+        ('queue', 'in', {'cpu', 'io'}),
+        ('task', '!=', {'tasks.io_bound'}),
+    ]
+    assert select('queue in (cpu,io),task!=tasks.io_bound', CPU, IO) == [CPU]
+
+
+def test_existence():
+    assert select('task', CPU, {'queue': 'cpu'}, UNLABELLED) == [CPU]
+    assert select('!task', CPU, {'queue': 'cpu'}, UNLABELLED) == [{'queue': 'cpu'}, UNLABELLED]
+    assert select('queue,!task', CPU, {'queue': 'cpu'}, UNLABELLED) == [{'queue': 'cpu'}]
+
+
+@pytest.mark.parametrize('text', [
+    '!queue=cpu',
+    '!queue in (cpu)',
+    'queue in ()',
+    'queue notin ( , )',
+    'queue in cpu',
+    'queue>cpu',
+    'queue=cpu io',
+])
+def test_invalid_terms_raise(text):
+    with pytest.raises(ValueError):
+        parse_selector(text)
@@ -0,0 +1,44 @@
+"""Predictive scaler: forecast damping and the recent-rate floor"""
+
+from predictive_scaler import HoltForecaster, PredictiveScaler
+
+
+def steady_scaler(rate=3.0, interval=5.0, samples=40, service_time=2.5):
+    """A scaler fed a constant arrival rate, returned with the last timestamp and count"""
+    scaler = PredictiveScaler(concurrency=2, min_replicas=2, max_replicas=10, horizon=60)
+    timestamp, completed = 0.0, 0
+    for _ in range(samples):
+        timestamp += interval
+        completed += rate * interval
+        scaler.observe(timestamp, 0, completed, service_time)
+    return scaler, timestamp, completed
+
+
+def test_steady_load_sizes_by_littles_law():
+    scaler, _, _ = steady_scaler()
+    # 3/s x 2.5 s = 7.5 busy slots over 2 slots per pod at 80% -> 5 pods
+    assert scaler.desired == 5
+
+
+def test_one_dip_does_not_collapse_forecast():
+    scaler, timestamp, completed = steady_scaler()
+    desired = scaler.observe(timestamp + 5, 0, completed, 2.5)
+    assert scaler.arrival_rate == 0
+    assert scaler.forecast_rate() > 2
+    assert desired == 5
+
+
+def test_sustained_drop_scales_down_after_horizon():
+    scaler, timestamp, completed = steady_scaler()
+    for _ in range(13):
+        timestamp += 5
+        scaler.observe(timestamp, 0, completed, 2.5)
+    assert scaler.desired == 2
+
+
+def test_damped_trend_stays_below_linear():
+    damped, linear = HoltForecaster(phi=0.98), HoltForecaster(phi=1.0)
+    for forecaster in (damped, linear):
+        for value in (1, 2, 3, 4, 5):
+            forecaster.update(value, 5)
+    assert damped.level < damped.forecast(60) < linear.forecast(60)
@@ -0,0 +1,81 @@
+"""Queue depth accounting over kombu's priority lists and unacked hash"""
+
+import json
+
+import fakeredis
+import pytest
+
+from queue_stats import PRIORITY_SEP, UNACKED_KEY, QueueDepthCollector, priority_keys
+
+
+def message(task):
+    return json.dumps({'body': '', 'headers': {'task': task}, 'properties': {}})
+
+
+def push(client, key, task, count):
+    for _ in range(count):
+        client.lpush(key, message(task))
+
+
+def unack(client, tag, task, routing_key, exchange=''):
+    client.hset(UNACKED_KEY, tag, json.dumps([json.loads(message(task)), exchange, routing_key]))
+
+
+@pytest.fixture
+def broker():
+    client = fakeredis.FakeRedis()
+    # cpu: 3 at priority 0, 2 at priority 9; io: 1 at priority 3; default empty
+    push(client, 'cpu', 'tasks.cpu_intensive', 3)
+    push(client, f'cpu{PRIORITY_SEP}9', 'tasks.mixed_task', 2)
+    push(client, f'io{PRIORITY_SEP}3', 'tasks.io_bound', 1)
+    unack(client, 'tag-1', 'tasks.cpu_intensive', 'cpu')
+    unack(client, 'tag-2', 'tasks.cpu_intensive', 'cpu')
+    unack(client, 'tag-3', 'tasks.io_bound', 'io')
+    return client
+
+
+def test_priority_keys_use_kombu_suffix():
+    assert priority_keys('cpu') == ['cpu', 'cpu\x06\x163', 'cpu\x06\x166', 'cpu\x06\x169']
+
+
+def test_depth_breakdown_counts_every_priority_list(broker):
+    breakdown = QueueDepthCollector(broker, queues=['default', 'cpu', 'io']).collect()
+    assert breakdown['by_priority'] == {
+        'default': {0: 0, 3: 0, 6: 0, 9: 0},
+        'cpu': {0: 3, 3: 0, 6: 0, 9: 2},
+        'io': {0: 0, 3: 1, 6: 0, 9: 0},
+    }
+    assert breakdown['queues'] == {'default': 0, 'cpu': 5, 'io': 1}
+    assert breakdown['ready'] == 6
+    assert breakdown['unacked'] == 3
+    assert breakdown['total'] == 9
+    assert 'tasks' not in breakdown and 'unacked_queues' not in breakdown
+
+
+def test_unacked_detail_attributes_entries_to_their_queue(broker):
+    broker.hset(UNACKED_KEY, 'tag-4', 'not json')
+    breakdown = QueueDepthCollector(broker, queues=['cpu', 'io'], unacked_detail=True).collect()
+    assert breakdown['unacked'] == 4
+    assert breakdown['unacked_queues'] == {
+        'cpu': {'tasks.cpu_intensive': 2},
+        'io': {'tasks.io_bound': 1},
+        'unknown': {'unknown': 1},
+    }
+
+
+def test_sample_splits_backlog_by_task(broker):
+    breakdown = QueueDepthCollector(broker, queues=['cpu', 'io'], sample_size=10).collect()
+    assert breakdown['tasks'] == {
+        'cpu': {'tasks.cpu_intensive': 3, 'tasks.mixed_task': 2},
+        'io': {'tasks.io_bound': 1},
+    }
+
+
+def test_partial_sample_scales_to_list_length():
+    client = fakeredis.FakeRedis()
+    push(client, 'cpu', 'tasks.cpu_intensive', 30)
+    push(client, 'cpu', 'tasks.io_bound', 10)
+    breakdown = QueueDepthCollector(client, queues=['cpu'], sample_size=10).collect()
+    # The 10 oldest messages (popped first) are all cpu_intensive
+    assert breakdown['tasks'] == {'cpu': {'tasks.cpu_intensive': 40}}
+    assert breakdown['queues'] == {'cpu': 40}
@@ -0,0 +1,84 @@
+"""msgpackz: payload flags, the compression threshold and kombu registration"""
+
+import datetime
+import os
+import uuid
+
+import pytest
+from kombu import serialization as kombu_serialization
+
+import serialization
+from serialization import CONTENT_TYPE, COMPACT_SERIALIZER, LZ4, RAW, ZLIB, dumps, loads
+
+pytestmark = pytest.mark.skipif(serialization.msgpack is None, reason='msgpack is not installed')
+
+SMALL = {'complexity': 500, 'execution_mode': 'numpy'}
+# Repetitive enough that both codecs shrink it well past the threshold
+LARGE = {'lines': ['Line %d: sample data for the io task\n' % i for i in range(200)], 'size': 200}
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lz4', 'none'])
+def test_small_payloads_stay_raw(compression):
+    data = dumps(SMALL, compression=compression, threshold=1024)
+    assert data[:1] == RAW
+    assert loads(data) == SMALL
+
+
+@pytest.mark.parametrize('compression, flag', [('zlib', ZLIB), ('lz4', LZ4), ('none', RAW)])
+def test_large_payloads_round_trip_through_each_codec(compression, flag):
+    if flag == LZ4 and serialization.lz4 is None:
+        pytest.skip('lz4 is not installed')
+    data = dumps(LARGE, compression=compression, threshold=1024)
+    assert data[:1] == flag
+    assert loads(data) == LARGE
+
+
+def test_threshold_is_inclusive():
+    packed_size = len(dumps(LARGE, compression='none')) - 1
+    assert dumps(LARGE, compression='zlib', threshold=packed_size)[:1] == ZLIB
+    assert dumps(LARGE, compression='zlib', threshold=packed_size + 1)[:1] == RAW
+
+
+def test_incompressible_payload_is_kept_raw():
+    noise = {'blob': os.urandom(4096)}
+    data = dumps(noise, compression='zlib', threshold=0)
+    assert data[:1] == RAW
+    assert loads(data) == noise
+
+
+def test_lz4_falls_back_to_zlib_when_missing(monkeypatch):
+    monkeypatch.setattr(serialization, 'lz4', None)
+    assert dumps(LARGE, compression='lz4', threshold=0)[:1] == ZLIB
+
+
+def test_lz4_payload_without_lz4_fails_clearly(monkeypatch):
+    if serialization.lz4 is None:
+        pytest.skip('lz4 is not installed')
+    data = dumps(LARGE, compression='lz4', threshold=0)
+    monkeypatch.setattr(serialization, 'lz4', None)
+    with pytest.raises(ValueError, match='lz4'):
+        loads(data)
+
+
+def test_unknown_flag_raises():
+    with pytest.raises(ValueError, match='flag'):
+        loads(b'\x07' + dumps(SMALL)[1:])
+
+
+def test_str_payloads_decode_as_latin1():
+    data = dumps(LARGE, compression='zlib', threshold=0)
+    assert loads(data.decode('latin-1')) == LARGE
+
+
+def test_json_compatible_types_are_encoded():
+    task_id = uuid.uuid4()
+    when = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    assert loads(dumps({'id': task_id, 'at': when, 'tags': {'a'}})) == {
+        'id': str(task_id), 'at': when.isoformat(), 'tags': ['a']}
+
+
+def test_registered_with_kombu():
+    assert serialization.register_compact_serializer()
+    content_type, encoding, data = kombu_serialization.dumps(LARGE, serializer=COMPACT_SERIALIZER)
+    assert (content_type, encoding) == (CONTENT_TYPE, 'binary')
+    assert kombu_serialization.loads(data, content_type, encoding, accept=[CONTENT_TYPE]) == LARGE
@@ -0,0 +1,72 @@
+"""Pipelined batch publishing writes the same messages as apply_async"""
+
+import json
+
+import fakeredis
+import pytest
+from kombu.transport import redis as kombu_redis
+
+from app.task_submitter import BatchSubmitter, app, cpu_intensive_task, io_bound_task, mixed_task, patched
+
+# Per-message values that differ between any two publishes
+VOLATILE_HEADERS = ('id', 'root_id', 'enqueued_at')
+VOLATILE_PROPERTIES = ('correlation_id', 'delivery_tag')
+
+TASKS = [
+    (cpu_intensive_task, {'complexity': 500}),
+    (io_bound_task, {'file_size': 1024}),
+    (mixed_task, {'cpu_complexity': 300, 'io_size': 2048}),
+    (cpu_intensive_task, {'complexity': 900}),
+]
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    monkeypatch.setattr(kombu_redis.Channel, 'connection_class', fakeredis.FakeRedisConnection)
+    client = fakeredis.FakeRedis.from_url(app.conf.broker_url)
+    client.flushall()
+    yield client
+    client.flushall()
+
+
+def queued(client):
+    """{queue key: [message without per-publish ids]} of every list in the broker"""
+    contents = {}
+    for key in sorted(client.keys('*')):
+        if client.type(key) != b'list':
+            continue
+        messages = []
+        for raw in client.lrange(key, 0, -1):
+            message = json.loads(raw)
+            for name in VOLATILE_HEADERS:
+                message['headers'].pop(name)
+            for name in VOLATILE_PROPERTIES:
+                message['properties'].pop(name)
+            messages.append(message)
+        contents[key] = messages
+    return contents
+
+
+def published_one_by_one(client):
+    with patched(app.backend, 'on_task_call', lambda producer, task_id: None):
+        for task, kwargs in TASKS:
+            task.apply_async(kwargs=kwargs)
+    return queued(client)
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 100])
+def test_pipelined_batches_match_apply_async(broker, batch_size):
+    expected = published_one_by_one(broker)
+    broker.flushall()
+    submitter = BatchSubmitter(batch_size=batch_size)
+    submitter.submit(TASKS)
+    assert submitter.published == len(TASKS)
+    assert queued(broker) == expected
+    assert set(expected) == {b'cpu', b'io'}
+
+
+def test_submit_restores_patched_attributes(broker):
+    BatchSubmitter(batch_size=2).submit(TASKS)
+    assert 'on_task_call' not in app.backend.__dict__
+    with app.producer_or_acquire() as producer:
+        assert '_create_client' not in producer.channel.__dict__
@@ -0,0 +1,75 @@
+"""Workload trace files: version 2 round trips and reading version 1 traces"""
+
+import pytest
+from celery.signals import before_task_publish
+
+from workload_trace import HEADER, MAGIC, RECORD_V1, TraceRecorder, TraceWriter, encode, read_trace
+
+SUBMISSIONS = [
+    (0.0, 'tasks.cpu_intensive', [], {'complexity': 1500}),
+    (0.25, 'tasks.io_bound', [2048], {}),
+    (1.5, 'tasks.mixed_task', [], {'cpu_complexity': 700, 'io_size': 900}),
+    (2.0, 'reports.build', ['weekly', [1, 2, 3]], {'options': {'format': 'csv', 'limit': None}}),
+]
+
+
+def test_v2_round_trip(tmp_path):
+    path = tmp_path / 'run.trace'
+    with TraceWriter(path) as writer:
+        for submission in SUBMISSIONS:
+            writer.write(*submission)
+    assert writer.count == len(SUBMISSIONS)
+    assert list(read_trace(path)) == SUBMISSIONS
+
+
+def test_v2_reader_stops_at_a_truncated_record(tmp_path):
+    path = tmp_path / 'run.trace'
+    with TraceWriter(path) as writer:
+        for submission in SUBMISSIONS:
+            writer.write(*submission)
+    path.write_bytes(path.read_bytes()[:-3])
+    assert list(read_trace(path)) == SUBMISSIONS[:-1]
+
+
+def test_reads_v1_traces(tmp_path):
+    path = tmp_path / 'old.trace'
+    path.write_bytes(HEADER.pack(MAGIC, 1)
+                     + RECORD_V1.pack(0.0, 0, 1500, 0)
+                     + RECORD_V1.pack(0.5, 1, 2048, 0)
+                     + RECORD_V1.pack(1.0, 2, 700, 900))
+    assert list(read_trace(path, chunk_records=2)) == [
+        (0.0, 'tasks.cpu_intensive', [], {'complexity': 1500}),
+        (0.5, 'tasks.io_bound', [], {'file_size': 2048}),
+        (1.0, 'tasks.mixed_task', [], {'cpu_complexity': 700, 'io_size': 900}),
+    ]
+
+
+@pytest.mark.parametrize('header', [HEADER.pack(b'NOPE', 2), HEADER.pack(MAGIC, 3)])
+def test_rejects_unknown_files(tmp_path, header):
+    path = tmp_path / 'bad.trace'
+    path.write_bytes(header)
+    with pytest.raises(ValueError):
+        list(read_trace(path))
+
+
+def test_encode_rejects_unstorable_arguments():
+    with pytest.raises(TypeError):
+        encode(0.0, 'tasks.io_bound', [object()], {})
+
+
+def test_recorder_captures_publishes_and_skips_unstorable_ones(tmp_path):
+    path = tmp_path / 'recorded.trace'
+    recorder = TraceRecorder(path).attach()
+    try:
+        # Protocol 2 bodies are (args, kwargs, embed); protocol 1 bodies are dicts
+        before_task_publish.send(sender='tasks.io_bound', body=([2048], {}, {}))
+        before_task_publish.send(sender='tasks.cpu_intensive', body={'args': [], 'kwargs': {'complexity': 9}})
+        before_task_publish.send(sender='tasks.io_bound', body=([object()], {}, {}))
+    finally:
+        count = recorder.close()
+    assert count == 2
+    assert recorder.skipped == {'tasks.io_bound': 1}
+    assert [record[1:] for record in read_trace(path)] == [
+        ('tasks.io_bound', [2048], {}),
+        ('tasks.cpu_intensive', [], {'complexity': 9}),
+    ]
@@ -0,0 +1,34 @@
+"""NumPy and pure-Python execution modes compute the same series"""
+
+import math
+
+import pytest
+
+from workloads import CHUNK_SIZE, np, series_sum
+
+pytestmark = pytest.mark.skipif(np is None, reason='numpy is not installed')
+
+COMPLEXITIES = [0, 1, 2, 100, 1000, CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 1, 2 * CHUNK_SIZE + 7]
+
+
+def assert_close(numpy_result, python_result, n):
+    # Chunked pairwise and sequential summation differ by rounding that grows with n
+    assert math.isclose(numpy_result, python_result, rel_tol=1e-9, abs_tol=1e-12 * max(n, 1) ** 1.5)
+
+
+@pytest.mark.parametrize('with_cos', [True, False])
+@pytest.mark.parametrize('n', COMPLEXITIES)
+def test_modes_agree(n, with_cos):
+    assert_close(series_sum(n, with_cos, mode='numpy'), series_sum(n, with_cos, mode='python'), n)
+
+
+@pytest.mark.parametrize('n', [6, 7, 8, 50])
+def test_modes_agree_across_small_chunks(n):
+    assert_close(series_sum(n, mode='numpy', chunk_size=7), series_sum(n, mode='python'), n)
+
+
+def test_numpy_progress_reports_every_chunk():
+    calls = []
+    result = series_sum(20, mode='numpy', chunk_size=8, on_progress=lambda i, partial: calls.append((i, partial)))
+    assert [i for i, _ in calls] == [8, 16, 20]
+    assert calls[-1][1] == result